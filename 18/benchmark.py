@@ -0,0 +1,175 @@
+# Banc d'essai du chatbot EPSI sans GPT4All (modèle factice StubModel)
+#
+# Exemples :
+#   python benchmark.py                                   # corpus intégré, 4 workers, 2 passages
+#   python benchmark.py --workers 1 --repeat 1 --token-delay 0.01
+#   python benchmark.py --questions questions.txt         # une question par ligne
+#   python benchmark.py --json resultats.json             # enregistre les mesures
+#   python benchmark.py --baseline resultats.json         # échoue si le débit ou le p95 régresse
+#
+# Le corpus est rejoué `--repeat` fois par `--workers` chatbots en parallèle (un modèle factice
+# chacun, cache et journal partagés, comme server.py). Dès le deuxième passage, les questions
+# générées au premier viennent du cache. Le rapport donne les latences p50/p95/p99, le débit et
+# la répartition FAQ / cache / modèle. Le cache et le journal sont écrits dans un dossier
+# temporaire : chaque exécution part d'un cache vide.
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import percentile
+from script import EPSIChatbot, StubModel, ResponseCache, ConversationLog
+
+QUESTIONS = [
+    "Quels sont les tarifs ?",
+    "Comment se passe l'alternance ?",
+    "Quel est le rythme de l'alternance ?",
+    "Quels métiers après l'EPSI ?",
+    "Quelles formations en cybersécurité ?",
+    "Comment candidater en Bachelor ?",
+    "Où se trouve le campus ?",
+    "Que fait le BDE ?",
+    "Y a-t-il des portes ouvertes ?",
+    "Quels équipements sur le campus ?",
+    "Peut-on intégrer en 3ème année ?",
+    "Quels secteurs recrutent les diplômés ?",
+    "Faut-il un ordinateur portable ?",
+    "Quelle est la durée du Mastère ?",
+    "Comment financer ses études ?",
+    "Quels événements organise l'école ?",
+]
+
+PATHS = ["faq", "cache", "modele"]
+
+
+def latency_summary(values):
+    """Nombre de réponses et latences p50/p95/p99 (en secondes)"""
+    return {"reponses": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95),
+            "p99": percentile(values, 99)}
+
+
+def load_questions(path):
+    """Lit un corpus : liste JSON ou une question par ligne"""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith(".json"):
+        return [str(question) for question in json.loads(text)]
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def make_chatbots(workers, folder, stub_options, reuse_prefix=False):
+    """Crée un chatbot par worker, avec un modèle factice chacun, et partage le cache et le journal"""
+    response_cache = ResponseCache(os.path.join(folder, "response_cache.json"))
+    conversation_log = ConversationLog(os.path.join(folder, "conversation_history.jsonl"))
+    chatbots = [EPSIChatbot(reuse_prefix=reuse_prefix, model_factory=lambda: StubModel(**stub_options),
+                            response_cache=response_cache, conversation_log=conversation_log)
+                for _ in range(workers)]
+    for chatbot in chatbots:
+        chatbot.model_ready.result()
+    return chatbots
+
+
+def replay(chatbots, questions):
+    """Rejoue les questions en parallèle (un thread par chatbot) : renvoie [(source, latence)]"""
+    available = list(chatbots)
+    lock = threading.Lock()
+    local = threading.local()
+
+    def ask(question):
+        # Chaque thread garde le même chatbot : un modèle n'est jamais partagé entre threads
+        if not hasattr(local, "chatbot"):
+            with lock:
+                local.chatbot = available.pop()
+        start = time.perf_counter()
+        local.chatbot.generate_response(question)
+        return local.chatbot.last_turn["source"], time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=len(chatbots)) as pool:
+        return list(pool.map(ask, questions))
+
+
+def run_benchmark(questions, workers=4, repeat=2, stub_options=None, reuse_prefix=False):
+    """Exécute le banc d'essai et renvoie le rapport"""
+    with tempfile.TemporaryDirectory(prefix="bench_chatbot_") as folder:
+        chatbots = make_chatbots(workers, folder, stub_options or {}, reuse_prefix)
+        start = time.perf_counter()
+        results = replay(chatbots, questions * repeat)
+        elapsed = time.perf_counter() - start
+        chatbots[0].conversation_history.close()
+
+    by_path = defaultdict(list)
+    for source, latency in results:
+        by_path[source].append(latency)
+    return {
+        "workers": workers,
+        "questions": len(results),
+        "secondes": elapsed,
+        "reponses_par_seconde": len(results) / elapsed if elapsed else None,
+        "latence": latency_summary([latency for _, latency in results]),
+        "chemins": {path: dict(latency_summary(by_path[path]), part=len(by_path[path]) / len(results))
+                    for path in PATHS},
+    }
+
+
+def print_report(report):
+    """Affiche le rapport sous forme de tableau"""
+    print(f"{report['questions']} questions, {report['workers']} worker(s) : {report['secondes']:.2f} s, "
+          f"{report['reponses_par_seconde']:.1f} réponses/s")
+    print(f"{'chemin':<8} {'part':>6} {'réponses':>9} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9}")
+    rows = list(report["chemins"].items()) + [("total", dict(report["latence"], part=1.0))]
+    for path, values in rows:
+        cells = ["-" if values[q] is None else f"{values[q] * 1000:.1f}" for q in ("p50", "p95", "p99")]
+        print(f"{path:<8} {values['part']:>6.0%} {values['reponses']:>9} {cells[0]:>9} {cells[1]:>9} {cells[2]:>9}")
+
+
+def regressions(report, baseline, tolerance):
+    """Compare à une référence : débit plus bas ou p95 plus haut que la tolérance"""
+    slower = []
+    if report["reponses_par_seconde"] < baseline["reponses_par_seconde"] * (1 - tolerance):
+        slower.append(f"débit : {report['reponses_par_seconde']:.1f} réponses/s "
+                      f"(référence {baseline['reponses_par_seconde']:.1f})")
+    if report["latence"]["p95"] > baseline["latence"]["p95"] * (1 + tolerance):
+        slower.append(f"p95 : {report['latence']['p95'] * 1000:.1f} ms "
+                      f"(référence {baseline['latence']['p95'] * 1000:.1f} ms)")
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai du chatbot EPSI avec un modèle factice")
+    parser.add_argument("--questions", help="corpus de questions (.json ou une par ligne) ; corpus intégré par défaut")
+    parser.add_argument("--workers", type=int, default=4, help="chatbots en parallèle (défaut : 4)")
+    parser.add_argument("--repeat", type=int, default=2, help="passages sur le corpus (défaut : 2)")
+    parser.add_argument("--session", action="store_true", help="réutiliser le prompt système (session de chat)")
+    parser.add_argument("--tokens", type=int, default=40, help="tokens par réponse générée (défaut : 40)")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="secondes par token généré (défaut : 0.02)")
+    parser.add_argument("--eval-delay", type=float, default=0.0005,
+                        help="secondes par token de prompt évalué (défaut : 0.0005)")
+    parser.add_argument("--json", help="fichier où enregistrer les mesures")
+    parser.add_argument("--baseline", help="mesures de référence (JSON) : échec si le débit ou le p95 régresse")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="écart toléré avec la référence (défaut : 0.2)")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions) if args.questions else QUESTIONS
+    stub_options = {"tokens": args.tokens, "token_delay": args.token_delay, "eval_delay": args.eval_delay}
+    report = run_benchmark(questions, args.workers, args.repeat, stub_options, args.session)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            slower = regressions(report, json.load(f), args.tolerance)
+        for line in slower:
+            print(f"Régression : {line}")
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
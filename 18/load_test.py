@@ -0,0 +1,81 @@
+# Test de charge du serveur HTTP du chatbot (server.py)
+#
+# Exemples :
+#   python load_test.py                                   # 40 questions, 8 clients simultanés
+#   python load_test.py --requests 100 --concurrency 16 --url http://127.0.0.1:8080/chat
+#
+# Pour voir le passage à l'échelle, lancer le serveur avec --workers 1, puis 2, puis 4 et
+# comparer le débit. Chaque question est rendue unique pour ne pas tomber dans le cache.
+import json
+import time
+import argparse
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import percentile
+
+QUESTIONS = [
+    "Quels métiers peut-on faire après l'école ?",
+    "Comment se passe l'alternance ?",
+    "Quelles formations en cybersécurité ?",
+    "Comment candidater en Bachelor ?",
+    "Que fait le BDE ?",
+    "Quels équipements sur le campus ?",
+]
+
+# Fonction pour envoyer une question : renvoie (statut HTTP, source de la réponse, durée)
+def ask(url, question, timeout):
+    data = json.dumps({"question": question}).encode("utf-8")
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            source = json.load(response).get("source")
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status, source = e.code, None
+    except OSError:
+        status, source = "connexion", None
+    return status, source, time.perf_counter() - start
+
+# Fonction pour lancer le test : `requests` questions envoyées par `concurrency` clients
+def run_load_test(url, requests=40, concurrency=8, timeout=120, unique=True):
+    questions = [QUESTIONS[i % len(QUESTIONS)] + (f" (visiteur {i})" if unique else "")
+                 for i in range(requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda q: ask(url, q, timeout), questions))
+    elapsed = time.perf_counter() - start
+    ok = [duration for status, _, duration in results if status == 200]
+    return {
+        "requetes": requests,
+        "clients": concurrency,
+        "secondes": elapsed,
+        "reponses_par_seconde": len(ok) / elapsed if elapsed else None,
+        "statuts": dict(Counter(str(status) for status, _, _ in results)),
+        "sources": dict(Counter(source for _, source, _ in results if source)),
+        "latence_p50": percentile(ok, 50),
+        "latence_p95": percentile(ok, 95),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge du serveur du chatbot EPSI")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/chat", help="adresse de la route /chat")
+    parser.add_argument("--requests", type=int, default=40, help="nombre de questions (défaut : 40)")
+    parser.add_argument("--concurrency", type=int, default=8, help="clients simultanés (défaut : 8)")
+    parser.add_argument("--timeout", type=float, default=120, help="délai côté client en secondes (défaut : 120)")
+    parser.add_argument("--repeat-questions", action="store_true",
+                        help="ne pas rendre les questions uniques (mesure le cache)")
+    args = parser.parse_args()
+
+    report = run_load_test(args.url, args.requests, args.concurrency, args.timeout, not args.repeat_questions)
+    print(f"{report['requetes']} requêtes, {report['clients']} clients : {report['secondes']:.1f} s, "
+          f"{report['reponses_par_seconde']:.2f} réponses/s")
+    print(f"Statuts : {report['statuts']}  Sources : {report['sources']}")
+    if report["latence_p50"] is not None:
+        print(f"Latence : p50 {report['latence_p50']:.2f} s, p95 {report['latence_p95']:.2f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# Métriques Prometheus du chatbot EPSI
+#
+# Compteurs, jauges et histogrammes au format texte de Prometheus, sans dépendance : le
+# serveur (server.py) les expose sur GET /metrics. Job de collecte : prometheus_job.yml.
+import threading
+import time
+from contextlib import contextmanager
+
+# Bornes des histogrammes (secondes) : étapes rapides (FAQ, recherche) et étapes du modèle
+FAST_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+MODEL_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+RATE_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 100)
+
+
+def format_labels(labelnames, values, extra=()):
+    """Formate les étiquettes d'un échantillon : {source="faq",le="0.1"}"""
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def format_value(value):
+    """Formate un nombre comme Prometheus (+Inf, entiers sans décimale)"""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def percentile(values, q):
+    """Centile par la méthode du rang le plus proche (None si aucune valeur)"""
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))]
+
+
+class Metric:
+    """Base des métriques : un nom, une aide, des étiquettes et une valeur par combinaison"""
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def key(self, labels):
+        """Valeurs des étiquettes, dans l'ordre déclaré"""
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} attend les étiquettes {self.labelnames}, reçu {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def samples(self):
+        """Lignes d'échantillons (nom, étiquettes, valeur)"""
+        with self.lock:
+            return [(self.name, format_labels(self.labelnames, key), value) for key, value in self.values.items()]
+
+    def expose(self):
+        """Bloc de texte de la métrique (HELP, TYPE puis échantillons)"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{labels} {format_value(value)}" for name, labels, value in self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Compteur (ne fait qu'augmenter)"""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Jauge (valeur instantanée)"""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    """Histogramme : répartition des valeurs observées dans des intervalles cumulés"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=MODEL_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Mesure la durée d'un bloc `with`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        lines = []
+        with self.lock:
+            for key, (counts, total) in self.values.items():
+                for bound, count in zip(self.buckets, counts):
+                    lines.append((f"{self.name}_bucket", format_labels(self.labelnames, key, [("le", format_value(bound))]), count))
+                lines.append((f"{self.name}_sum", format_labels(self.labelnames, key), total))
+                lines.append((f"{self.name}_count", format_labels(self.labelnames, key), counts[-1]))
+        return lines
+
+
+class Registry:
+    """Ensemble des métriques exposées"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def expose(self):
+        """Texte complet à renvoyer sur /metrics"""
+        return "\n".join(metric.expose() for metric in self.metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# Étapes d'une réponse
+FAQ_LOOKUP = Histogram("chatbot_faq_lookup_seconds", "Durée de la recherche dans la FAQ", buckets=FAST_BUCKETS)
+RETRIEVAL = Histogram("chatbot_retrieval_seconds", "Durée de la recherche du contexte dans la base de connaissances",
+                      buckets=FAST_BUCKETS)
+PROMPT_BUILD = Histogram("chatbot_prompt_build_seconds", "Durée de construction du prompt", buckets=FAST_BUCKETS)
+MODEL_WAIT = Histogram("chatbot_model_wait_seconds", "Attente du chargement du modèle avant génération")
+PROMPT_EVAL = Histogram("chatbot_prompt_eval_seconds", "Évaluation du prompt par le modèle (jusqu'au premier token)")
+GENERATION = Histogram("chatbot_generation_seconds", "Génération des tokens après le premier")
+TOKENS = Counter("chatbot_tokens_generated_total", "Tokens générés par le modèle")
+TOKENS_PER_SECOND = Histogram("chatbot_tokens_per_second", "Débit de génération par réponse", buckets=RATE_BUCKETS)
+
+# Origine des réponses : taux de FAQ et de cache = rate(...{source="faq"}) / rate(... total)
+RESPONSES = Counter("chatbot_responses_total", "Réponses par origine (faq, cache, modele)", ["source"])
+RESPONSE_TIME = Histogram("chatbot_response_seconds", "Durée totale d'une réponse", ["source"])
+CACHE_LOOKUPS = Counter("chatbot_cache_lookups_total", "Recherches dans le cache des réponses (hit, miss)", ["result"])
+
+# Serveur HTTP
+HTTP_RESPONSES = Counter("chatbot_http_responses_total", "Réponses HTTP par route et code", ["route", "code"])
+QUEUE_DEPTH = Gauge("chatbot_queue_depth", "Questions en attente d'un worker")
+BUSY_WORKERS = Gauge("chatbot_busy_workers", "Workers en cours de génération")
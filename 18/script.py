@@ -1,35 +1,671 @@
-from gpt4all import GPT4All
+import gzip
+import hashlib
 import json
+import math
 import os
+import queue
+import random
+import re
+import shutil
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict, deque, namedtuple
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime
 
+import metrics
+
+MODEL_NAME = "orca-mini-3b-gguf2-q4_0.gguf"
+KNOWLEDGE_FILE = "knowledge.json"
+FAQ_FILE = "faq.json"
+
+# Mapping des mots-clés vers les sections (sert à enrichir la question avant la recherche)
+KEYWORDS_MAP = {
+    "programmes": ["programme", "formation", "bachelor", "mastère", "mastere", "cursus", "diplôme", "etudes"],
+    "admission": ["admission", "candidature", "candidater", "postuler", "inscription", "entrer", "parcoursup",
+                  "intégrer", "integrer"],
+    "campus": ["campus", "locaux", "où", "ou", "situé", "adresse", "batiment", "equipement"],
+    "debouches": ["débouché", "debouche", "métier", "metier", "emploi", "carrière", "carriere", "travail", "job"],
+    "vie_etudiante": ["vie étudiante", "vie etudiante", "bde", "événement", "evenement", "association", "sortie"],
+    "alternance": ["alternance", "rythme", "entreprise", "salaire", "contrat"],
+    "financement": ["financement", "financer", "bourse", "aide", "frais", "tarif", "tarifs", "prix", "coût", "cout"]
+}
+
+# Préfixe fixe du prompt : évalué une seule fois par session de chat
+SYSTEM_PROMPT = """Tu es une IA représentant l'EPSI Lyon, école d'ingénierie informatique.
+Tu dois répondre de manière précise, amicale et professionnelle aux questions des futurs étudiants.
+Utilise UNIQUEMENT les informations fournies ci-dessous pour répondre.
+Si tu ne trouves pas l'information, dis-le honnêtement et invite à contacter l'école.
+
+Règles importantes:
+- Sois précis et concis
+- Utilise un ton amical mais professionnel
+- Ne pas inventer d'informations
+- Reste positif sur l'école
+"""
+
+# Partie variable du prompt, ajoutée à chaque question
+TURN_PROMPT = """
+INFORMATIONS DISPONIBLES:
+{context}
+
+Question de l'étudiant: {question}
+
+Réponse (sois naturel et direct):"""
+
+# Mots trop fréquents pour aider à choisir un fait
+STOPWORDS = set("""le la les un une des de du d l et ou a au aux en dans sur pour par avec est sont
+que qui quoi quel quelle quels quelles ce cet cette ces se sa son ses je tu il elle on nous vous ils
+elles me te mon ma mes ton ta tes votre vos notre nos y ne pas plus comment combien quand pourquoi
+est-ce c qu s j n t m""".split())
+
+
+def normalize_text(text):
+    """Met un texte en minuscules et sans accents"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    """Découpe un texte en mots normalisés, sans les mots vides"""
+    return [word for word in re.findall(r"\w+", normalize_text(text)) if word not in STOPWORDS]
+
+
+class KnowledgeIndex:
+    """Index lexical (BM25) sur les faits élémentaires de la base de connaissances
+
+    La base est aplatie une fois au chargement : chaque clé d'une section devient un fait,
+    et les éléments d'une liste sont joints sur une seule ligne (les k faits retenus sont
+    donc k clés complètes, pas k morceaux de liste). La ligne de prompt de chaque fait est
+    sérialisée à ce moment-là, puis réutilisée telle quelle à chaque question.
+    """
+
+    def __init__(self, knowledge_base, keywords_map=KEYWORDS_MAP, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        # Mots-clés comparés en mots entiers, sur le texte normalisé ("ou" ne doit pas
+        # correspondre à "bonjour")
+        self.keyword_patterns = {
+            section: re.compile(r"\b(?:" + "|".join(re.escape(normalize_text(k)) for k in keywords) + r")\b")
+            for section, keywords in keywords_map.items()
+        }
+        self.facts = list(self.flatten(knowledge_base))
+        self.lines = [f"- {key.replace('_', ' ')} : {text}" for _, key, text in self.facts]
+        # Empreinte du contenu de chaque fait : stable d'un rechargement à l'autre, elle sert
+        # de clé au cache des réponses (contrairement à l'identifiant, qui est une position)
+        self.fact_keys = [hashlib.sha256(f"{section}\n{line}".encode("utf-8")).hexdigest()[:16]
+                          for (section, _, _), line in zip(self.facts, self.lines)]
+
+        # Index inversé : mot -> liste de (fait, fréquence)
+        self.postings = {}
+        self.lengths = []
+        for fact_id, (section, key, text) in enumerate(self.facts):
+            terms = Counter(tokenize(f"{section} {key} {text}"))
+            self.lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self.postings.setdefault(term, []).append((fact_id, tf))
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        n_facts = len(self.facts)
+        self.idf = {term: math.log(1 + (n_facts - len(docs) + 0.5) / (len(docs) + 0.5))
+                    for term, docs in self.postings.items()}
+
+    @staticmethod
+    def flatten(knowledge_base):
+        """Génère les faits (section, clé, texte) de la base de connaissances"""
+        for section, content in knowledge_base.items():
+            if isinstance(content, dict):
+                items = content.items()
+            else:
+                items = [(section, content)]
+            for key, value in items:
+                values = value if isinstance(value, list) else [value]
+                yield section, key, " ; ".join(
+                    item if isinstance(item, str) else json.dumps(item, ensure_ascii=False) for item in values)
+
+    def expand_query(self, question):
+        """Ajoute à la question le nom des sections dont un mot-clé y apparaît"""
+        question_norm = normalize_text(question)
+        sections = [section for section, pattern in self.keyword_patterns.items()
+                    if pattern.search(question_norm)]
+        return tokenize(question) + tokenize(" ".join(sections))
+
+    def search(self, question, k=5):
+        """Renvoie les identifiants des k faits les plus pertinents (score BM25 décroissant)"""
+        scores = Counter()
+        for term in set(self.expand_query(question)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for fact_id, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[fact_id] / self.avg_length)
+                scores[fact_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return [fact_id for fact_id, _ in scores.most_common(k)]
+
+    def section_facts(self, section):
+        """Renvoie les identifiants des faits d'une section"""
+        return [fact_id for fact_id, fact in enumerate(self.facts) if fact[0] == section]
+
+    def format_context(self, fact_ids):
+        """Construit le contexte du prompt, fait par fait, regroupé par section"""
+        by_section = {}
+        for fact_id in fact_ids:
+            by_section.setdefault(self.facts[fact_id][0], []).append(self.lines[fact_id])
+        return "\n\n".join(f"### {section.upper()}\n" + "\n".join(lines)
+                            for section, lines in by_section.items())
+
+
+class FAQMatcher:
+    """Recherche des mots-clés de la FAQ dans une question (automate d'Aho-Corasick)
+
+    Les mots-clés sont compilés au chargement en un seul automate : une question est lue une
+    fois, quel que soit le nombre de mots-clés. Un mot-clé doit couvrir des mots entiers (un
+    « s » ou « x » de pluriel est toléré) et le plus long trouvé l'emporte. Les réponses sont
+    stockées une seule fois ; chaque mot-clé n'en garde que l'indice.
+    """
+
+    def __init__(self, faq):
+        self.answers = []
+        self.aliases = {}
+        answer_ids = {}
+        for keywords, answer in self.entries(faq):
+            answer_id = answer_ids.setdefault(answer, len(answer_ids))
+            if answer_id == len(self.answers):
+                self.answers.append(answer)
+            for keyword in keywords:
+                self.aliases.setdefault(normalize_text(keyword).strip(), answer_id)
+        self.build()
+
+    @staticmethod
+    def entries(faq):
+        """Parcourt la FAQ : liste de {"mots_cles", "reponse"} ou dictionnaire mot-clé -> réponse"""
+        if isinstance(faq, dict):
+            return (([keyword], answer) for keyword, answer in faq.items())
+        return ((entry["mots_cles"], entry["reponse"]) for entry in faq)
+
+    def build(self):
+        """Construit l'automate : arbre des mots-clés, liens d'échec et sorties"""
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for keyword, answer_id in self.aliases.items():
+            if not keyword:
+                continue
+            state = 0
+            for char in keyword:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append((len(keyword), answer_id))
+
+        # Parcours en largeur : chaque état hérite des sorties de son lien d'échec
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, child in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0) if state else 0
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+                queue.append(child)
+        for outputs in self.output:
+            outputs.sort(reverse=True)
+
+    @staticmethod
+    def is_word_end(text, end):
+        """Vérifie qu'un mot-clé finissant à `end` couvre un mot entier (pluriel toléré)"""
+        if end < len(text) and text[end] in "sx":
+            end += 1
+        return end >= len(text) or not text[end].isalnum()
+
+    def match(self, question):
+        """Renvoie la réponse du plus long mot-clé présent dans la question, ou None"""
+        text = normalize_text(question)
+        best_length, best_answer = 0, None
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for length, answer_id in self.output[state]:
+                start = i + 1 - length
+                if length <= best_length:
+                    break
+                if (start == 0 or not text[start - 1].isalnum()) and self.is_word_end(text, i + 1):
+                    best_length, best_answer = length, answer_id
+                    break
+        return None if best_answer is None else self.answers[best_answer]
+
+
+class ResponseCache:
+    """Cache persistant des réponses générées, devant le modèle
+
+    La clé est la question normalisée (minuscules, sans accents ni mots vides) plus les
+    empreintes des faits de contexte retrouvés pour elle : deux formulations proches qui
+    mènent au même contexte partagent la même réponse. Les entrées expirent après `ttl`
+    secondes, les moins récemment utilisées sont évincées au-delà de `max_entries`, et une
+    entrée est invalidée dès qu'un de ses faits disparaît ou change dans la base.
+    """
+
+    def __init__(self, path="response_cache.json", valid_facts=None, max_entries=500, ttl=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.load(valid_facts)
+
+    @staticmethod
+    def make_key(question, fact_keys):
+        """Construit la clé d'une question et de son contexte"""
+        return " ".join(tokenize(question)) + "|" + ",".join(sorted(fact_keys))
+
+    def load(self, valid_facts=None):
+        """Charge le cache depuis le disque (sans les entrées expirées ou dont un fait a changé)"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        now = time.time()
+        valid_facts = None if valid_facts is None else set(valid_facts)
+        stale = 0
+        for key, entry in data.get("entries", []):
+            if now - entry["created"] >= self.ttl:
+                continue
+            if valid_facts is not None and not valid_facts.issuperset(entry.get("facts", [None])):
+                stale += 1
+                continue
+            self.entries[key] = entry
+        if stale:
+            print(f"♻️  Base de connaissances modifiée : {stale} réponse(s) du cache invalidée(s).")
+
+    def save(self):
+        """Écrit le cache sur le disque (fichier temporaire puis renommage, une écriture à la fois)"""
+        with self.save_lock:
+            with self.lock:
+                data = {"entries": list(self.entries.items())}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def get(self, key):
+        """Renvoie la réponse en cache, ou None si absente ou expirée"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry["created"] >= self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry["response"]
+
+    def put(self, key, response, fact_keys=()):
+        """Ajoute une réponse, évince les plus anciennes au-delà de la taille maximale et sauvegarde"""
+        with self.lock:
+            self.entries[key] = {"response": response, "created": time.time(), "facts": sorted(fact_keys)}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        self.save()
+
+    def invalidate(self, valid_facts):
+        """Retire les réponses construites sur un fait absent de la nouvelle base ; renvoie leur nombre"""
+        valid_facts = set(valid_facts)
+        with self.lock:
+            stale = [key for key, entry in self.entries.items()
+                     if not valid_facts.issuperset(entry.get("facts", [None]))]
+            for key in stale:
+                del self.entries[key]
+        if stale:
+            self.save()
+        return len(stale)
+
+
+class FileWatcher:
+    """Surveille des fichiers et appelle `callback` quand l'un d'eux change
+
+    Le thread compare toutes les `interval` secondes la date de modification et la taille de
+    chaque fichier. Une erreur du callback (fichier en cours d'écriture par exemple) est
+    affichée ; le prochain changement relance le callback.
+    """
+
+    def __init__(self, paths, callback, interval=1.0):
+        self.paths = paths
+        self.callback = callback
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.last_signature = self.signature()
+        self.thread = threading.Thread(target=self.run, name="surveillance-fichiers", daemon=True)
+
+    def signature(self):
+        """Date de modification et taille de chaque fichier (None s'il est absent)"""
+        signature = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return signature
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            signature = self.signature()
+            if signature == self.last_signature:
+                continue
+            self.last_signature = signature
+            try:
+                self.callback()
+            except Exception as e:
+                print(f"\n⚠️  Rechargement impossible, l'ancienne version est conservée : {e}")
+
+
+# Données d'une version de la base : remplacées d'un bloc lors d'un rechargement
+Knowledge = namedtuple("Knowledge", ["base", "index", "faq"])
+
+
+def load_gpt4all(model_name=MODEL_NAME):
+    """Charge le modèle GPT4All (import au dernier moment : le chatbot marche aussi avec StubModel)"""
+    from gpt4all import GPT4All
+    return GPT4All(model_name)
+
+
+class StubModel:
+    """Modèle factice et déterministe, avec la même interface que GPT4All
+
+    La réponse dépend uniquement du prompt. Les délais imitent un vrai modèle : `eval_delay`
+    par token de prompt nouveau (dans une session, le prompt système n'est évalué qu'une fois),
+    puis `token_delay` par token généré. Sert à mesurer le chatbot sans charger GPT4All.
+    """
+
+    WORDS = ("l'EPSI", "Lyon", "propose", "une", "formation", "en", "alternance", "avec", "des",
+             "projets", "et", "un", "accompagnement", "vers", "l'emploi", "dans", "le", "numérique")
+
+    def __init__(self, eval_delay=0.0005, token_delay=0.02, tokens=40, chars_per_token=3):
+        self.eval_delay = eval_delay
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.chars_per_token = chars_per_token
+        self.pending_prefix = ""
+
+    @contextmanager
+    def chat_session(self, system_prompt=None, prompt_template=None):
+        """Session de chat : le prompt système sera évalué avec le premier tour seulement"""
+        self.pending_prefix = system_prompt or ""
+        try:
+            yield
+        finally:
+            self.pending_prefix = ""
+
+    def generate(self, prompt, max_tokens=200, streaming=False, **kwargs):
+        """Génère une réponse déterministe (flux de tokens si `streaming`)"""
+        evaluated = self.pending_prefix + prompt
+        self.pending_prefix = ""
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+        tokens = [" " + rng.choice(self.WORDS) for _ in range(min(max_tokens, self.tokens))]
+
+        def stream():
+            time.sleep(math.ceil(len(evaluated) / self.chars_per_token) * self.eval_delay)
+            for token in tokens:
+                time.sleep(self.token_delay)
+                yield token
+
+        return stream() if streaming else "".join(stream())
+
+
+class ConversationLog:
+    """Journal des conversations en JSON Lines, écrit au fil de l'eau
+
+    Chaque échange est ajouté à une file et écrit par un thread d'arrière-plan, avec un fsync
+    par lot (toutes les `flush_interval` secondes au plus) : un arrêt brutal ne perd que le
+    dernier lot. Au-delà de `max_bytes`, le fichier est compressé en `<fichier>.1.gz` (les
+    anciens deviennent .2.gz, .3.gz... jusqu'à `backups`). Seuls les `window` derniers échanges
+    restent en mémoire.
+
+    La file d'attente est bornée à `max_pending` échanges : si le disque ne suit plus ou si le
+    thread d'écriture s'est arrêté, les nouveaux échanges ne sont plus écrits (comptés dans
+    `dropped`, avec un avertissement) au lieu de remplir la mémoire.
+    """
+
+    def __init__(self, path="conversation_history.jsonl", window=100, max_bytes=5 * 1024 * 1024,
+                 backups=5, flush_interval=1.0, max_pending=10000):
+        self.path = path
+        self.recent = deque(maxlen=window)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.count = 0
+        self.dropped = 0
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.writer = threading.Thread(target=self.write_loop, name="journal-conversations", daemon=True)
+        self.writer.start()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(list(self.recent))
+
+    def append(self, record):
+        """Ajoute un échange (écrit en arrière-plan)"""
+        self.recent.append(record)
+        self.count += 1
+        if self.writer.is_alive():
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                pass
+        self.dropped += 1
+        if self.dropped == 1:
+            state = "saturé" if self.writer.is_alive() else "arrêté"
+            print(f"⚠️ Journal des conversations {state} : les échanges ne sont plus écrits dans {self.path}")
+
+    def close(self):
+        """Écrit les échanges en attente et arrête le thread d'écriture"""
+        if self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
+
+    def write_loop(self):
+        """Thread d'écriture : regroupe les échanges et fait un fsync par lot"""
+        closing = False
+        while not closing:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not None:
+                try:
+                    batch.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                closing = True
+                batch.pop()
+            if batch:
+                try:
+                    self.write_batch(batch)
+                except OSError as e:
+                    print(f"❌ Erreur d'écriture du journal ({len(batch)} échange(s) perdu(s)): {e}")
+
+    def write_batch(self, batch):
+        """Ajoute un lot au fichier, le synchronise sur le disque et fait la rotation si besoin"""
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in batch)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        if size >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        """Compresse le fichier courant et décale les anciens"""
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}.gz"):
+                os.replace(f"{self.path}.{i}.gz", f"{self.path}.{i + 1}.gz")
+        tmp_path = f"{self.path}.1.gz.tmp"
+        with open(self.path, 'rb') as src, gzip.open(tmp_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, f"{self.path}.1.gz")
+        os.remove(self.path)
+
+
+class TokenBudget:
+    """Budget de tokens d'une session de chat
+
+    Le nombre de tokens est estimé à partir du nombre de caractères (environ 3 par token en
+    français). Le contexte retrouvé est rogné à `context_tokens`, et la session doit être
+    rouverte quand le prochain tour ne tient plus dans la fenêtre `n_ctx` du modèle.
+    """
+
+    def __init__(self, n_ctx=2048, context_tokens=400, answer_tokens=250, chars_per_token=3):
+        self.n_ctx = n_ctx
+        self.context_tokens = context_tokens
+        self.answer_tokens = answer_tokens
+        self.chars_per_token = chars_per_token
+
+    def count(self, text):
+        """Estime le nombre de tokens d'un texte"""
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def trim_facts(self, knowledge_index, fact_ids):
+        """Garde les faits les mieux classés tant qu'ils tiennent dans le budget de contexte"""
+        kept, used = [], 0
+        for fact_id in fact_ids:
+            cost = self.count(knowledge_index.lines[fact_id]) + 1
+            if kept and used + cost > self.context_tokens:
+                break
+            kept.append(fact_id)
+            used += cost
+        return kept
+
+    def fits(self, used_tokens, prompt):
+        """Indique si un tour (prompt + réponse) tient encore dans la fenêtre du modèle"""
+        return used_tokens + self.count(prompt) + self.answer_tokens <= self.n_ctx
+
+
 class EPSIChatbot:
-    def __init__(self):
-        print("🔄 Chargement du modèle GPT4All...")
-        self.model = GPT4All("orca-mini-3b-gguf2-q4_0.gguf")
-        print("✅ Modèle chargé avec succès!")
+    def __init__(self, context_facts=5, reuse_prefix=True, budget=None, response_cache=None, conversation_log=None,
+                 model_factory=load_gpt4all):
+        # Le modèle se charge en arrière-plan : FAQ et cache répondent pendant ce temps
+        self.startup_timings = {}
+        self.model_load_time = None
+        self.model_ready = Future()
+        self.model_factory = model_factory
+        self.last_turn = None
+        print("🔄 Chargement du modèle en arrière-plan...")
+        threading.Thread(target=self.load_model, name="chargement-modele", daemon=True).start()
         
         # Charger la base de connaissances
-        self.knowledge_base = self.load_knowledge_base()
-        self.faq = self.load_faq()
-        self.conversation_history = []
+        self.knowledge = self.build_knowledge(self.timed)
+        self.context_facts = context_facts
+        self.response_cache = response_cache or self.timed(
+            "cache", lambda: ResponseCache(valid_facts=self.knowledge.index.fact_keys))
+        self.conversation_history = ConversationLog() if conversation_log is None else conversation_log
+        # Durée du modèle à part : elle est écrite par le thread de chargement, avant model_ready
+        timings = dict(self.startup_timings)
+        model_loaded = self.model_ready.done()
+        if model_loaded and self.model_load_time is not None:
+            timings = {"modele": self.model_load_time, **timings}
+        print("⏱️  Démarrage : " + ", ".join(f"{phase} {seconds:.2f} s" for phase, seconds in timings.items())
+              + ("" if model_loaded else " (modèle encore en chargement)"))
+        
+        # Session de chat : le prompt système n'est évalué qu'à l'ouverture
+        self.budget = budget or TokenBudget()
+        self.reuse_prefix = reuse_prefix
+        self.session = None
+        self.session_tokens = 0
+        self.last_metrics = None
         
+    def timed(self, phase, function, *args):
+        """Exécute une phase du démarrage et enregistre sa durée"""
+        start = time.perf_counter()
+        result = function(*args)
+        self.startup_timings[phase] = time.perf_counter() - start
+        return result
+    
+    def load_model(self):
+        """Charge le modèle (thread d'arrière-plan) et résout `model_ready`"""
+        try:
+            start = time.perf_counter()
+            model = self.model_factory()
+            self.model_load_time = time.perf_counter() - start
+        except Exception as e:
+            print(f"\n❌ Erreur lors du chargement du modèle: {e}")
+            print(f"Assurez-vous que le modèle '{MODEL_NAME}' est téléchargé.")
+            self.model_ready.set_exception(e)
+        else:
+            self.model_ready.set_result(model)
+            print(f"✅ Modèle chargé avec succès! ({self.model_load_time:.1f} s)")
+    
+    @property
+    def model(self):
+        """Modèle de langage (attend la fin du chargement si besoin)"""
+        return self.model_ready.result()
+    
+    @property
+    def knowledge_base(self):
+        return self.knowledge.base
+    
+    @property
+    def knowledge_index(self):
+        return self.knowledge.index
+    
+    @property
+    def faq(self):
+        return self.knowledge.faq
+    
+    def build_knowledge(self, timed=None):
+        """Charge la base de connaissances et la FAQ, et construit leurs index"""
+        timed = timed or (lambda phase, function, *args: function(*args))
+        knowledge_base = timed("base_connaissances", self.load_knowledge_base)
+        return Knowledge(
+            base=knowledge_base,
+            index=timed("index", KnowledgeIndex, knowledge_base),
+            faq=timed("faq", lambda: FAQMatcher(self.load_faq()))
+        )
+    
+    def reload_knowledge(self):
+        """Recharge la base et la FAQ, puis les remplace d'un bloc (le modèle n'est pas touché)"""
+        knowledge = self.build_knowledge()
+        self.knowledge = knowledge
+        stale = self.response_cache.invalidate(knowledge.index.fact_keys)
+        print(f"\n♻️  Base de connaissances et FAQ rechargées ({stale} réponse(s) du cache invalidée(s))")
+    
+    def watch_knowledge(self, interval=1.0):
+        """Recharge la base et la FAQ dès que leurs fichiers changent (thread d'arrière-plan)"""
+        return FileWatcher([KNOWLEDGE_FILE, FAQ_FILE], self.reload_knowledge, interval).start()
+    
     def load_knowledge_base(self):
         """Charge la base de connaissances depuis le fichier JSON"""
         try:
-            with open('knowledge_base.json', 'r', encoding='utf-8') as f:
+            with open(KNOWLEDGE_FILE, 'r', encoding='utf-8') as f:
                 return json.load(f)
         except FileNotFoundError:
-            print("⚠️  Fichier knowledge_base.json introuvable. Utilisation des données par défaut.")
+            print(f"⚠️  Fichier {KNOWLEDGE_FILE} introuvable. Utilisation des données par défaut.")
             return self.get_default_knowledge_base()
     
     def load_faq(self):
         """Charge les FAQ depuis le fichier JSON"""
         try:
-            with open('faq.json', 'r', encoding='utf-8') as f:
+            with open(FAQ_FILE, 'r', encoding='utf-8') as f:
                 return json.load(f)
         except FileNotFoundError:
-            print("⚠️  Fichier faq.json introuvable. Utilisation des FAQ par défaut.")
+            print(f"⚠️  Fichier {FAQ_FILE} introuvable. Utilisation des FAQ par défaut.")
             return self.get_default_faq()
     
     def get_default_knowledge_base(self):
@@ -120,96 +756,178 @@ class EPSIChatbot:
             "international": "L'EPSI propose des opportunités de stages à l'international et des partenariats avec des universités étrangères pour des échanges académiques."
         }
     
-    def find_relevant_context(self, question):
-        """Trouve le contexte pertinent selon la question"""
-        question_lower = question.lower()
-        relevant_sections = []
-        
-        # Mapping des mots-clés vers les sections
-        keywords_map = {
-            "programmes": ["programme", "formation", "bachelor", "mastère", "mastere", "cursus", "diplôme", "etudes"],
-            "admission": ["admission", "candidature", "inscription", "entrer", "parcoursup", "intégrer", "integrer"],
-            "campus": ["campus", "locaux", "où", "ou", "situé", "adresse", "batiment", "equipement"],
-            "debouches": ["débouché", "debouche", "métier", "metier", "emploi", "carrière", "carriere", "travail", "job"],
-            "vie_etudiante": ["vie étudiante", "vie etudiante", "bde", "événement", "evenement", "association", "sortie"],
-            "alternance": ["alternance", "rythme", "entreprise", "salaire", "contrat"]
-        }
+    def retrieve_facts(self, question, knowledge=None):
+        """Trouve les faits pertinents selon la question (les mieux classés seulement)"""
+        index = (knowledge or self.knowledge).index
+        fact_ids = index.search(question, self.context_facts)
         
-        # Chercher les sections pertinentes
-        for section, keywords in keywords_map.items():
-            if any(keyword in question_lower for keyword in keywords):
-                if section in self.knowledge_base:
-                    relevant_sections.append(f"### {section.upper()}\n{json.dumps(self.knowledge_base[section], ensure_ascii=False, indent=2)}")
+        # Si aucun fait ne correspond, retourner l'info générale
+        if not fact_ids:
+            fact_ids = index.section_facts("general")
         
-        # Si aucune section spécifique, retourner l'info générale
-        if not relevant_sections:
-            relevant_sections.append(f"### INFORMATIONS GÉNÉRALES\n{json.dumps(self.knowledge_base.get('general', {}), ensure_ascii=False, indent=2)}")
-        
-        return "\n\n".join(relevant_sections)
+        return self.budget.trim_facts(index, fact_ids)
+    
+    def find_relevant_context(self, question):
+        """Trouve le contexte pertinent selon la question"""
+        knowledge = self.knowledge
+        return knowledge.index.format_context(self.retrieve_facts(question, knowledge))
+    
+    def open_session(self):
+        """Ouvre une session de chat : le prompt système est évalué une fois, puis réutilisé"""
+        self.close_session()
+        self.session = self.model.chat_session(system_prompt=SYSTEM_PROMPT, prompt_template="{0}")
+        self.session.__enter__()
+        self.session_tokens = self.budget.count(SYSTEM_PROMPT)
+    
+    def close_session(self):
+        """Ferme la session de chat en cours (libère le contexte du modèle)"""
+        if self.session is not None:
+            self.session.__exit__(None, None, None)
+            self.session = None
+            self.session_tokens = 0
     
-    def check_faq(self, question):
+    def prepare_prompt(self, question, relevant_context):
+        """Construit le prompt à soumettre au modèle
+
+        En mode session, seule la partie variable (contexte + question) est envoyée : le modèle
+        garde le préfixe déjà évalué. La session est rouverte quand la fenêtre est pleine.
+        """
+        turn_prompt = TURN_PROMPT.format(context=relevant_context, question=question)
+        if not self.reuse_prefix:
+            return f"{SYSTEM_PROMPT}\n{turn_prompt}"
+        if self.session is None or not self.budget.fits(self.session_tokens, turn_prompt):
+            self.open_session()
+        self.session_tokens += self.budget.count(turn_prompt) + self.budget.answer_tokens
+        return turn_prompt
+    
+    def check_faq(self, question, knowledge=None):
         """Vérifie si la question correspond à une FAQ"""
-        question_lower = question.lower()
-        for key, answer in self.faq.items():
-            if key in question_lower:
-                return answer
-        return None
+        return (knowledge or self.knowledge).faq.match(question)
     
-    def generate_response(self, question):
-        """Génère une réponse à la question"""
+    def lookup(self, question, knowledge=None):
+        """Prépare une réponse sans le modèle : FAQ, recherche du contexte puis cache
+
+        Renvoie (réponse, source, faits retrouvés) ; la réponse vaut None si elle doit être générée.
+        `knowledge` fixe la version de la base utilisée, pour qu'un rechargement en cours de
+        réponse ne mélange pas deux versions.
+        """
+        knowledge = knowledge or self.knowledge
+        
         # Vérifier d'abord les FAQ
-        faq_response = self.check_faq(question)
+        with metrics.FAQ_LOOKUP.time():
+            faq_response = self.check_faq(question, knowledge)
         if faq_response:
-            return faq_response
+            return faq_response, "faq", None
         
-        # Construire le prompt avec contexte pertinent
-        relevant_context = self.find_relevant_context(question)
+        with metrics.RETRIEVAL.time():
+            fact_ids = self.retrieve_facts(question, knowledge)
         
-        system_prompt = """Tu es une IA représentant l'EPSI Lyon, école d'ingénierie informatique.
-Tu dois répondre de manière précise, amicale et professionnelle aux questions des futurs étudiants.
-Utilise UNIQUEMENT les informations fournies ci-dessous pour répondre.
-Si tu ne trouves pas l'information, dis-le honnêtement et invite à contacter l'école.
-
-Règles importantes:
-- Sois précis et concis
-- Utilise un ton amical mais professionnel
-- Ne pas inventer d'informations
-- Reste positif sur l'école
-"""
-        
-        full_prompt = f"""{system_prompt}
-
-INFORMATIONS DISPONIBLES:
-{relevant_context}
+        # Question déjà posée avec le même contexte : réponse en cache
+        fact_keys = [knowledge.index.fact_keys[fact_id] for fact_id in fact_ids]
+        cached_response = self.response_cache.get(ResponseCache.make_key(question, fact_keys))
+        metrics.CACHE_LOOKUPS.inc(result="miss" if cached_response is None else "hit")
+        return cached_response, "cache", fact_ids
+    
+    def prepare(self, question):
+        """Fixe la version de la base et cherche une réponse sans le modèle
 
-Question de l'étudiant: {question}
+        Renvoie (base, réponse, source, faits retrouvés) : la réponse vaut None si elle doit être
+        générée. Le résultat se passe tel quel à stream_response, qui ne refait pas la recherche.
+        """
+        knowledge = self.knowledge
+        return (knowledge, *self.lookup(question, knowledge))
+    
+    def stream_response(self, question, prepared=None):
+        """Génère une réponse à la question, token par token
 
-Réponse (sois naturel et direct):"""
+        Les réponses de la FAQ et du cache sont renvoyées d'un bloc. Pour une réponse générée,
+        le temps jusqu'au premier token et le débit (tokens/s) sont enregistrés dans
+        l'historique et dans `last_metrics`. `prepared` est le résultat de prepare() si la
+        recherche a déjà été faite (elle n'est alors ni refaite ni comptée deux fois).
+        """
+        start = time.perf_counter()
+        self.last_metrics = None
+        
+        # FAQ ou réponse en cache : pas besoin du modèle
+        knowledge, response, source, fact_ids = prepared or self.prepare(question)
+        if response is not None:
+            self.record_turn(question, response, source, duree=time.perf_counter() - start)
+            yield response
+            return
+        
+        # Attendre le modèle s'il est encore en chargement
+        wait_start = time.perf_counter()
+        model = self.model
+        model_wait = time.perf_counter() - wait_start
+        metrics.MODEL_WAIT.observe(model_wait)
+        
+        # Construire le prompt avec contexte pertinent
+        with metrics.PROMPT_BUILD.time():
+            fact_keys = [knowledge.index.fact_keys[fact_id] for fact_id in fact_ids]
+            cache_key = ResponseCache.make_key(question, fact_keys)
+            relevant_context = knowledge.index.format_context(fact_ids)
+            full_prompt = self.prepare_prompt(question, relevant_context)
         
-        # Générer la réponse
-        response = self.model.generate(
+        # Générer la réponse en flux
+        tokens = []
+        first_token = None
+        generate_start = time.perf_counter()
+        for token in model.generate(
             full_prompt,
-            max_tokens=250,
+            max_tokens=self.budget.answer_tokens,
             temp=0.7,
             top_k=40,
             top_p=0.9,
-            repeat_penalty=1.2
-        )
+            repeat_penalty=1.2,
+            streaming=True
+        ):
+            if first_token is None:
+                first_token = time.perf_counter() - start
+                metrics.PROMPT_EVAL.observe(time.perf_counter() - generate_start)
+            tokens.append(token)
+            yield token
+        
+        elapsed = time.perf_counter() - start
+        generation_time = elapsed - (first_token or 0)
+        self.last_metrics = {
+            "attente_modele": model_wait,
+            "ttft": first_token,
+            "duree": elapsed,
+            "tokens": len(tokens),
+            "tokens_par_seconde": (len(tokens) - 1) / generation_time if len(tokens) > 1 and generation_time else None
+        }
+        metrics.GENERATION.observe(generation_time)
+        metrics.TOKENS.inc(len(tokens))
+        if self.last_metrics["tokens_par_seconde"] is not None:
+            metrics.TOKENS_PER_SECOND.observe(self.last_metrics["tokens_par_seconde"])
+        response = "".join(tokens)
         
         # Sauvegarder dans l'historique
-        self.conversation_history.append({
+        self.record_turn(question, response, "modele", **self.last_metrics)
+        
+        self.response_cache.put(cache_key, response.strip(), fact_keys)
+    
+    def record_turn(self, question, response, source, **turn_metrics):
+        """Ajoute un échange au journal, avec sa source (faq, cache, modele) et ses durées"""
+        metrics.RESPONSES.inc(source=source)
+        metrics.RESPONSE_TIME.observe(turn_metrics["duree"], source=source)
+        self.last_turn = {
             "timestamp": datetime.now().isoformat(),
             "question": question,
-            "response": response
-        })
-        
-        return response.strip()
+            "response": response,
+            "source": source,
+            **turn_metrics
+        }
+        self.conversation_history.append(self.last_turn)
+    
+    def generate_response(self, question, prepared=None):
+        """Génère une réponse à la question (`prepared` : voir stream_response)"""
+        return "".join(self.stream_response(question, prepared)).strip()
     
     def save_history(self):
-        """Sauvegarde l'historique des conversations"""
+        """Écrit les derniers échanges du journal des conversations"""
+        self.conversation_history.close()
         if self.conversation_history:
-            with open('conversation_history.json', 'w', encoding='utf-8') as f:
-                json.dump(self.conversation_history, f, ensure_ascii=False, indent=2)
             print(f"\n💾 Historique sauvegardé ({len(self.conversation_history)} conversations)")
     
     def run(self):
@@ -227,6 +945,9 @@ Réponse (sois naturel et direct):"""
         print("\nTapez 'quit' ou 'exit' pour quitter")
         print("="*60 + "\n")
         
+        # Modifier knowledge.json ou faq.json recharge les réponses sans redémarrer
+        watcher = self.watch_knowledge()
+        
         while True:
             try:
                 question = input("💬 Vous: ").strip()
@@ -236,16 +957,28 @@ Réponse (sois naturel et direct):"""
                 
                 if question.lower() in ["quit", "exit", "quitter", "sortir"]:
                     print("\n👋 Merci de votre visite! À bientôt à l'EPSI Lyon!")
+                    watcher.stop()
+                    self.close_session()
                     self.save_history()
                     break
                 
+                prepared = self.prepare(question)
+                if not self.model_ready.done() and prepared[1] is None:
+                    print("⏳ Le modèle termine son chargement, merci de patienter...")
                 print("\n🤖 EPSI IA: ", end="", flush=True)
-                response = self.generate_response(question)
-                print(response)
-                print()
+                started = False
+                for token in self.stream_response(question, prepared):
+                    # Ignorer les espaces en tête de réponse
+                    if not started:
+                        token = token.lstrip()
+                        started = bool(token)
+                    print(token, end="", flush=True)
+                print("\n")
                 
             except KeyboardInterrupt:
                 print("\n\n👋 Au revoir!")
+                watcher.stop()
+                self.close_session()
                 self.save_history()
                 break
             except Exception as e:
@@ -258,7 +991,7 @@ def main():
         chatbot.run()
     except Exception as e:
         print(f"❌ Erreur lors du démarrage: {e}")
-        print("Assurez-vous que le modèle 'orca-mini-3b-gguf2-q4_0.gguf' est téléchargé.")
+        print(f"Assurez-vous que le modèle '{MODEL_NAME}' est téléchargé.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,274 @@
+# Serveur HTTP du chatbot EPSI (asyncio), pour le site des portes ouvertes
+#
+# Exemples :
+#   python server.py                                  # 2 workers sur le port 8080
+#   python server.py --workers 4 --queue 32 --timeout 60
+#   python server.py --stub                           # modèle factice (tests de charge sans GPT4All)
+#
+# Routes :
+#   POST /chat     {"question": "..."}  ->  {"response": "...", "source": "faq|cache|modele", "duree": 0.12}
+#   GET  /health   état des workers (modèles prêts compris) et de la file d'attente
+#   GET  /metrics  métriques Prometheus (voir metrics.py et prometheus_job.yml)
+#
+# Les réponses de la FAQ et du cache sont servies tout de suite, sans attendre derrière les
+# générations. Les autres questions passent par une file bornée, vidée par un pool de workers
+# qui ont chacun leur propre modèle : file pleine -> 429, délai dépassé -> 504.
+# Modifier knowledge.json ou faq.json met à jour tous les workers sans recharger les modèles.
+import argparse
+import asyncio
+import functools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import metrics
+from script import EPSIChatbot, StubModel, FileWatcher, KNOWLEDGE_FILE, FAQ_FILE
+
+MAX_BODY = 64 * 1024
+READ_TIMEOUT = 10
+
+
+class ChatServer:
+    """Serveur HTTP asyncio devant un pool de chatbots
+
+    Chaque worker a son chatbot (donc son modèle) et son propre thread : un modèle GPT4All
+    n'est jamais utilisé par deux threads. Les workers partagent le cache des réponses et le
+    journal des conversations. Ils n'utilisent pas de session de chat, qui mélangerait les
+    questions de visiteurs différents.
+    """
+
+    def __init__(self, workers=2, queue_size=16, timeout=60.0, chatbot_factory=EPSIChatbot):
+        self.n_workers = workers
+        self.timeout = timeout
+        self.chatbot_factory = chatbot_factory
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.chatbots = []
+        self.executors = []
+        self.tasks = []
+        self.watcher = None
+        self.busy = 0
+        self.counters = {"faq": 0, "cache": 0, "modele": 0, "rejetees": 0, "expirees": 0, "erreurs": 0}
+
+    async def start(self):
+        """Crée un chatbot par worker (dans le thread du worker) et lance les workers
+
+        Chaque chatbot charge son modèle en arrière-plan, dans son propre thread
+        (« chargement-modele ») : un worker peut donc démarrer avant que son modèle soit prêt,
+        ce que /health indique dans `prets`.
+        """
+        loop = asyncio.get_running_loop()
+        for i in range(self.n_workers):
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"chatbot-{i}")
+            shared = {"response_cache": self.chatbots[0].response_cache,
+                      "conversation_log": self.chatbots[0].conversation_history} if self.chatbots else {}
+            chatbot = await loop.run_in_executor(
+                executor, lambda: self.chatbot_factory(reuse_prefix=False, **shared))
+            self.chatbots.append(chatbot)
+            self.executors.append(executor)
+            self.tasks.append(asyncio.create_task(self.worker(chatbot, executor)))
+        self.watcher = FileWatcher([KNOWLEDGE_FILE, FAQ_FILE], self.reload_knowledge).start()
+
+    def reload_knowledge(self):
+        """Recharge la base et la FAQ une fois et les donne à tous les workers (thread du watcher)"""
+        knowledge = self.chatbots[0].build_knowledge()
+        for chatbot in self.chatbots:
+            chatbot.knowledge = knowledge
+        stale = self.chatbots[0].response_cache.invalidate(knowledge.index.fact_keys)
+        print(f"♻️  Base de connaissances et FAQ rechargées ({stale} réponse(s) du cache invalidée(s))")
+
+    async def stop(self):
+        """Arrête les workers et libère leurs threads"""
+        if self.watcher:
+            self.watcher.stop()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        for executor in self.executors:
+            executor.shutdown(wait=True)
+        if self.chatbots:
+            self.chatbots[0].conversation_history.close()
+
+    async def worker(self, chatbot, executor):
+        """Vide la file d'attente : une génération à la fois sur le modèle de ce worker"""
+        loop = asyncio.get_running_loop()
+        while True:
+            question, prepared, future = await self.queue.get()
+            try:
+                # Délai dépassé pendant l'attente : inutile de générer
+                if future.done():
+                    continue
+                self.busy += 1
+                try:
+                    response = await loop.run_in_executor(executor, chatbot.generate_response, question, prepared)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(response)
+                finally:
+                    self.busy -= 1
+            finally:
+                self.queue.task_done()
+
+    async def answer(self, question):
+        """Répond à une question : renvoie (statut HTTP, données, en-têtes supplémentaires)"""
+        start = time.perf_counter()
+
+        # FAQ ou cache : réponse immédiate, sans passer par la file. Sinon, la recherche faite
+        # ici est transmise au worker, qui génère sans la refaire
+        prepared = self.chatbots[0].prepare(question)
+        _, response, source, _ = prepared
+        if response is not None:
+            self.chatbots[0].record_turn(question, response, source, duree=time.perf_counter() - start)
+            self.counters[source] += 1
+            return HTTPStatus.OK, {"response": response, "source": source,
+                                   "duree": time.perf_counter() - start}, {}
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((question, prepared, future))
+        except asyncio.QueueFull:
+            self.counters["rejetees"] += 1
+            return HTTPStatus.TOO_MANY_REQUESTS, {"error": "Serveur occupé, réessayez dans un instant."}, \
+                {"Retry-After": "5"}
+
+        try:
+            response = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.counters["expirees"] += 1
+            return HTTPStatus.GATEWAY_TIMEOUT, {"error": "La réponse a pris trop de temps."}, {}
+        except Exception as e:
+            self.counters["erreurs"] += 1
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}, {}
+        self.counters["modele"] += 1
+        return HTTPStatus.OK, {"response": response, "source": "modele",
+                               "duree": time.perf_counter() - start}, {}
+
+    def health(self):
+        """État du serveur"""
+        ready = sum(1 for chatbot in self.chatbots
+                    if chatbot.model_ready.done() and chatbot.model_ready.exception() is None)
+        return {"workers": self.n_workers, "prets": ready, "occupes": self.busy, "file": self.queue.qsize(),
+                "file_max": self.queue.maxsize, "compteurs": self.counters}
+
+    async def read_request(self, reader):
+        """Lit une requête HTTP/1.1 : renvoie (méthode, chemin, corps)"""
+        request_line = (await reader.readline()).decode("latin-1")
+        method, path, _ = request_line.split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        if length > MAX_BODY:
+            raise ValueError("Requête trop volumineuse")
+        body = await reader.readexactly(length) if length else b""
+        return method, path.split("?", 1)[0], body
+
+    async def dispatch(self, reader):
+        """Lit la requête, l'envoie à la bonne route et compte la réponse"""
+        try:
+            method, path, body = await asyncio.wait_for(self.read_request(reader), READ_TIMEOUT)
+        except (ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            method, path, result = None, "invalide", (HTTPStatus.BAD_REQUEST, {"error": "Requête invalide"}, {})
+        else:
+            try:
+                result = await self.route(method, path, body)
+            except Exception as e:
+                print(f"❌ Erreur sur {method} {path}: {e}")
+                result = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Erreur interne du serveur"}, {}
+        route = path if path in ("/chat", "/health", "/metrics") else "autre"
+        metrics.HTTP_RESPONSES.inc(route=route, code=str(result[0].value))
+        return result
+
+    def expose_metrics(self):
+        """Texte des métriques Prometheus (l'état de la file est relevé à la demande)"""
+        metrics.QUEUE_DEPTH.set(self.queue.qsize())
+        metrics.BUSY_WORKERS.set(self.busy)
+        return metrics.REGISTRY.expose()
+
+    async def route(self, method, path, body):
+        """Envoie une requête à la bonne route"""
+        if method == "OPTIONS":
+            return HTTPStatus.NO_CONTENT, None, {}
+        if path == "/health" and method == "GET":
+            return HTTPStatus.OK, self.health(), {}
+        if path == "/metrics" and method == "GET":
+            return HTTPStatus.OK, self.expose_metrics(), {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        if path == "/chat" and method == "POST":
+            try:
+                question = str(json.loads(body)["question"]).strip()
+            except (ValueError, KeyError, TypeError):
+                return HTTPStatus.BAD_REQUEST, {"error": "Corps attendu : {\"question\": \"...\"}"}, {}
+            if not question:
+                return HTTPStatus.BAD_REQUEST, {"error": "Question vide"}, {}
+            return await self.answer(question)
+        return HTTPStatus.NOT_FOUND, {"error": "Route inconnue"}, {}
+
+    async def handle(self, reader, writer):
+        """Traite une connexion (une requête par connexion), fermée dans tous les cas"""
+        try:
+            status, payload, extra_headers = await self.dispatch(reader)
+            if payload is None:
+                body = b""
+            elif isinstance(payload, str):
+                body = payload.encode("utf-8")
+            else:
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            headers = {
+                "Content-Type": "application/json; charset=utf-8",
+                "Content-Length": str(len(body)),
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+                "Access-Control-Allow-Headers": "Content-Type",
+                "Connection": "close",
+                **extra_headers
+            }
+            head = f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            head += "".join(f"{name}: {value}\r\n" for name, value in headers.items()) + "\r\n"
+            writer.write(head.encode("latin-1") + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host, port, **options):
+    """Démarre le serveur et le garde actif jusqu'à l'interruption"""
+    server = ChatServer(**options)
+    print(f"🔄 Chargement de {server.n_workers} modèle(s)...")
+    await server.start()
+    http_server = await asyncio.start_server(server.handle, host, port)
+    print(f"✅ Chatbot disponible sur http://{host}:{port}/chat ({server.n_workers} worker(s))")
+    try:
+        async with http_server:
+            await http_server.serve_forever()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur HTTP du chatbot EPSI Lyon")
+    parser.add_argument("--host", default="127.0.0.1", help="adresse d'écoute (défaut : 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="port d'écoute (défaut : 8080)")
+    parser.add_argument("--workers", type=int, default=2, help="workers, un modèle chacun (défaut : 2)")
+    parser.add_argument("--queue", type=int, default=16, help="taille maximale de la file d'attente (défaut : 16)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="délai maximal par requête en secondes (défaut : 60)")
+    parser.add_argument("--stub", action="store_true", help="utiliser le modèle factice StubModel au lieu de GPT4All")
+    args = parser.parse_args()
+    factory = functools.partial(EPSIChatbot, model_factory=StubModel) if args.stub else EPSIChatbot
+    try:
+        asyncio.run(serve(args.host, args.port, workers=args.workers, queue_size=args.queue, timeout=args.timeout,
+                          chatbot_factory=factory))
+    except KeyboardInterrupt:
+        print("\n👋 Serveur arrêté.")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,17 +5,47 @@ Version finale - 2 fichiers seulement
 
 from flask import Flask, render_template, request, jsonify
 import os
+import re
 import numpy as np
 import json
+import copy
+import time
+import uuid
+import atexit
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import SGDClassifier
+from sklearn.preprocessing import StandardScaler
+import sklearn
 import joblib
 
+from audio_features import (AudioError, FEATURE_DIM, FEATURES_VERSION, decode_wav, extract_features, extract_batch,
+                            synthetic_clip)
+
 app = Flask(__name__)
 
 # Configuration
-MODEL_FILE = "spell_model.pkl"
-SAMPLES_FILE = "user_samples.json"
+# Échantillons utilisateur : fichiers binaires en ajout seul (voir SampleStore). Le modèle
+# n'est écrit qu'aux points de sauvegarde : après chaque réentraînement complet, toutes les
+# CHECKPOINT_EVERY versions et à l'arrêt, dans une archive compressée et numérotée
+SAMPLES_DIR = "samples"
+MODEL_DIR = "models"
+CHECKPOINT_EVERY = 10
+KEEP_CHECKPOINTS = 3
+CHECKPOINT_NAME = re.compile(r"spell_model-v(\d+)\.joblib\.gz")
+
+# Mode d'entraînement : "full" par défaut (forêt refaite à chaque fois) ou, sur demande
+# (SPELL_TRAINING_MODE=incremental), "incremental" (seuls les nouveaux échantillons sont
+# appris, avec un réentraînement complet toutes les COMPACT_EVERY mises à jour)
+TRAINING_MODE = os.environ.get("SPELL_TRAINING_MODE", "full")
+COMPACT_EVERY = 20
+# Dérive mesurée à chaque réentraînement complet, sur des échantillons de validation : un
+# échantillon utilisateur sur HOLDOUT_EVERY (20 %) n'est pas appris par les mises à jour
+# incrémentales (il l'est au réentraînement complet suivant), au plus DRIFT_SAMPLES d'entre eux
+HOLDOUT_EVERY = 5
+DRIFT_SAMPLES = 200
 
 # Formules magiques
 SPELLS = {
@@ -29,147 +59,504 @@ SPELLS = {
     "Stupefy": "Étourdit l'adversaire"
 }
 
+# Réentraînement en arrière-plan : attendre TRAIN_DEBOUNCE s sans nouvel échantillon (au plus
+# TRAIN_MAX_DELAY s) pour regrouper une rafale d'envois en un seul réentraînement
+TRAIN_DEBOUNCE = 2.0
+TRAIN_MAX_DELAY = 10.0
+MAX_JOBS = 200
+
+# Reconnaissance par lots : fichiers décodés BATCH_CHUNK par BATCH_CHUNK (mémoire bornée), puis
+# une seule prédiction sur toutes les caractéristiques
+MAX_BATCH_FILES = 200
+BATCH_CHUNK = 32
+TOP_K = 3
+app.config['MAX_CONTENT_LENGTH'] = 64 * 1024 * 1024
+
 # Variables globales
 model = None
-user_samples = {}
-
-def create_features(spell_name):
-    """Crée des caractéristiques basées sur le nom de la formule"""
-    features = []
-    
-    # Caractéristiques de base
-    features.append(len(spell_name))
-    features.append(sum(ord(c) for c in spell_name.lower()) / 100)
-    features.append(hash(spell_name) % 100 / 100)
-    
-    # Caractéristiques spécifiques par formule
-    spell_features = {
-        "Lumos": [0.8, 0.6, 0.4, 0.7, 0.9],
-        "Nox": [0.4, 0.3, 0.2, 0.5, 0.3],
-        "Accio": [0.7, 0.8, 0.6, 0.9, 0.7],
-        "Expelliarmus": [0.9, 0.7, 0.8, 0.8, 0.9],
-        "Alohomora": [0.6, 0.5, 0.7, 0.6, 0.6],
-        "Stupefy": [0.5, 0.6, 0.5, 0.7, 0.5],
-        "Wingardium Leviosa": [0.3, 0.4, 0.3, 0.4, 0.2],
-        "Petrificus Totalus": [0.8, 0.9, 0.8, 0.9, 0.8]
-    }
+model_version = 0
+last_drift = None
+checkpoint_version = 0
+sample_store = None
+
+# Tâches d'entraînement : id -> statut (en_attente, en_cours, termine, erreur)
+training_jobs = OrderedDict()
+pending_jobs = []
+jobs_lock = threading.Lock()
+train_requested = threading.Event()
+
+class SampleStore:
+    """Échantillons utilisateur en binaire, en ajout seul
+    
+    `features.f32` contient une ligne float32 par échantillon, `labels.u8` l'indice de sa
+    formule (un octet) et `index.json` la dimension et le nom des formules. Un ajout écrit à
+    la fin des deux fichiers puis force l'écriture sur disque : O(1), quel que soit le nombre
+    d'échantillons. À l'ouverture, un échantillon incomplet (arrêt pendant une écriture) est
+    retiré, et les caractéristiques sont lues à la demande par projection mémoire.
+    
+    Des échantillons d'une autre version des caractéristiques (audio_features.FEATURES_VERSION)
+    sont mis de côté dans `<folder>-v<version>` : le magasin repart vide.
+    """
     
-    features.extend(spell_features.get(spell_name, [0.5, 0.5, 0.5, 0.5, 0.5]))
+    def __init__(self, folder=SAMPLES_DIR):
+        os.makedirs(folder, exist_ok=True)
+        self.features_path = os.path.join(folder, "features.f32")
+        self.labels_path = os.path.join(folder, "labels.u8")
+        self.index_path = os.path.join(folder, "index.json")
+        self.lock = threading.Lock()
+        
+        self.dim, self.labels = None, []
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            if index.get('features') != FEATURES_VERSION:
+                # Nom unique : un dossier mis de côté auparavant n'est jamais écrasé
+                base = f"{folder}-v{index.get('features', 0)}-{datetime.now():%Y%m%d-%H%M%S}"
+                aside, suffix = base, 1
+                while os.path.exists(aside):
+                    aside, suffix = f"{base}-{suffix}", suffix + 1
+                os.replace(folder, aside)
+                os.makedirs(folder)
+                print(f"⚠️ Échantillons d'une autre version des caractéristiques déplacés dans {aside}")
+            else:
+                self.dim, self.labels = index['dim'], index['labels']
+        
+        # Seuls les échantillons complets dans les deux fichiers sont gardés
+        self.features_file = open(self.features_path, 'ab')
+        self.labels_file = open(self.labels_path, 'ab')
+        rows = os.path.getsize(self.features_path) // (4 * self.dim) if self.dim else 0
+        self.count = min(rows, os.path.getsize(self.labels_path))
+        self.features_file.truncate(self.count * 4 * (self.dim or 0))
+        self.labels_file.truncate(self.count)
+        
+        label_ids = np.fromfile(self.labels_path, dtype=np.uint8)
+        self.counts = np.bincount(label_ids, minlength=len(self.labels)).tolist()
     
-    # Variations temporelles
-    import time
-    current_time = time.time()
-    features.append((current_time % 100) / 100)
-    features.append((hash(str(current_time)) % 100) / 100)
+    def __len__(self):
+        return self.count
     
-    # Variations aléatoires
-    for i in range(20):
-        features.append(np.random.normal(0, 0.1))
+    def save_index(self):
+        """Écrit la dimension et les formules (fichier temporaire puis renommage)"""
+        with open(self.index_path + ".tmp", 'w') as f:
+            json.dump({'features': FEATURES_VERSION, 'dim': self.dim, 'labels': self.labels}, f)
+        os.replace(self.index_path + ".tmp", self.index_path)
     
-    return np.array(features)
+    def append(self, spell_name, features):
+        """Ajoute un échantillon et renvoie le nombre d'échantillons de cette formule"""
+        row = np.asarray(features, dtype='<f4').ravel()
+        with self.lock:
+            if self.dim is None:
+                self.dim = len(row)
+                self.save_index()
+            elif len(row) != self.dim:
+                raise ValueError(f"{len(row)} caractéristiques au lieu de {self.dim}")
+            if spell_name not in self.labels:
+                if len(self.labels) > 255:
+                    raise ValueError("Trop de formules différentes")
+                self.labels.append(spell_name)
+                self.counts.append(0)
+                self.save_index()
+            label_id = self.labels.index(spell_name)
+            
+            # Caractéristiques d'abord : sans étiquette, une ligne est ignorée à l'ouverture
+            for f, data in ((self.features_file, row.tobytes()), (self.labels_file, bytes([label_id]))):
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self.count += 1
+            self.counts[label_id] += 1
+            return self.counts[label_id]
+    
+    def rows(self, start=0, stop=None):
+        """Échantillons [start, stop) : caractéristiques projetées en mémoire et formules"""
+        with self.lock:
+            count = self.count
+        stop = count if stop is None else min(stop, count)
+        if start >= stop:
+            return np.empty((0, self.dim or 0), dtype=np.float32), []
+        X = np.memmap(self.features_path, dtype='<f4', mode='r', shape=(count, self.dim))[start:stop]
+        label_ids = np.memmap(self.labels_path, dtype=np.uint8, mode='r', shape=(count,))[start:stop]
+        names = np.array(self.labels, dtype=object)
+        return X, list(names[label_ids])
+    
+    def spell_counts(self):
+        """Nombre d'échantillons par formule"""
+        with self.lock:
+            return {spell: n for spell, n in zip(self.labels, self.counts) if n}
 
-def save_data():
-    """Sauvegarde le modèle et les échantillons"""
+def checkpoint_model():
+    """Point de sauvegarde : archive compressée et numérotée du modèle, puis `latest.json`"""
+    global checkpoint_version
+    current_model, version = model, model_version
+    if current_model is None:
+        return
+    
     try:
-        if model is not None:
-            joblib.dump(model, MODEL_FILE)
-            print(f"✅ Modèle sauvegardé: {MODEL_FILE}")
+        # Un autre processus (ou une exécution précédente) a déjà sauvegardé un modèle plus récent
+        latest = read_latest()
+        if latest and latest.get('version', 0) > version:
+            print(f"⚠️ Sauvegarde v{version:05d} ignorée: latest.json pointe déjà vers v{latest['version']:05d}")
+            return
         
-        with open(SAMPLES_FILE, 'w') as f:
-            samples_to_save = {}
-            for spell, samples in user_samples.items():
-                samples_to_save[spell] = [sample.tolist() for sample in samples]
-            json.dump(samples_to_save, f)
-        print(f"✅ Échantillons sauvegardés: {SAMPLES_FILE}")
+        os.makedirs(MODEL_DIR, exist_ok=True)
+        filename = f"spell_model-v{version:05d}.joblib.gz"
+        path = os.path.join(MODEL_DIR, filename)
+        joblib.dump(current_model, path + ".tmp", compress=("gzip", 3))
+        os.replace(path + ".tmp", path)
         
+        latest = {
+            'version': version,
+            'file': filename,
+            'mode': TRAINING_MODE,
+            'features': FEATURES_VERSION,
+            'samples': len(sample_store) if sample_store is not None else 0,
+            'sklearn': sklearn.__version__,
+            'date': datetime.now().isoformat()
+        }
+        latest_path = os.path.join(MODEL_DIR, "latest.json")
+        with open(latest_path + ".tmp", 'w') as f:
+            json.dump(latest, f, indent=2)
+        os.replace(latest_path + ".tmp", latest_path)
+        checkpoint_version = version
+        print(f"✅ Modèle sauvegardé: {path}")
+        
+        # Seules les KEEP_CHECKPOINTS archives les plus récentes sont gardées, dont celle-ci
+        older = sorted((name for name in checkpoint_archives() if name != filename),
+                       key=lambda name: os.path.getmtime(os.path.join(MODEL_DIR, name)), reverse=True)
+        for name in older[KEEP_CHECKPOINTS - 1:]:
+            os.remove(os.path.join(MODEL_DIR, name))
+    
     except Exception as e:
         print(f"❌ Erreur sauvegarde: {e}")
 
+def read_latest():
+    """Contenu de `latest.json` (None s'il n'existe pas)"""
+    latest_path = os.path.join(MODEL_DIR, "latest.json")
+    if not os.path.exists(latest_path):
+        return None
+    with open(latest_path, 'r') as f:
+        return json.load(f)
+
+def checkpoint_archives():
+    """Noms des archives du modèle présentes dans MODEL_DIR"""
+    if not os.path.isdir(MODEL_DIR):
+        return []
+    return [name for name in os.listdir(MODEL_DIR) if CHECKPOINT_NAME.fullmatch(name)]
+
+def last_checkpoint_version():
+    """Plus haut numéro d'archive déjà utilisé : la numérotation reprend après"""
+    return max((int(CHECKPOINT_NAME.fullmatch(name).group(1)) for name in checkpoint_archives()), default=0)
+
+def save_data():
+    """Sauvegarde le modèle s'il a changé depuis le dernier point de sauvegarde (arrêt)"""
+    if model_version != checkpoint_version:
+        checkpoint_model()
+
 def load_data():
-    """Charge le modèle et les échantillons"""
-    global model, user_samples
+    """Charge le dernier point de sauvegarde du modèle et ouvre les échantillons"""
+    global model, model_version, checkpoint_version, sample_store
+    
+    # Un modèle recréé ne doit pas réutiliser (puis écraser) le numéro d'une ancienne archive
+    model_version = checkpoint_version = last_checkpoint_version()
+    loaded = False
+    
+    # Chargement des échantillons : sans eux, aucune route d'entraînement ne peut répondre,
+    # une erreur ici arrête donc le démarrage plutôt que de servir des erreurs 500
+    sample_store = SampleStore()
+    print(f"✅ Échantillons chargés: {len(sample_store)} ({len(sample_store.spell_counts())} formules)")
     
     try:
-        # Chargement du modèle
-        if os.path.exists(MODEL_FILE):
-            model = joblib.load(MODEL_FILE)
-            print(f"✅ Modèle chargé: {MODEL_FILE}")
-        else:
-            print("🆕 Création nouveau modèle...")
-            create_model()
-        
-        # Chargement des échantillons
-        if os.path.exists(SAMPLES_FILE):
-            with open(SAMPLES_FILE, 'r') as f:
-                samples_data = json.load(f)
-                for spell, samples in samples_data.items():
-                    user_samples[spell] = [np.array(sample) for sample in samples]
-            print(f"✅ Échantillons chargés: {len(user_samples)} formules")
-        else:
-            print("🆕 Aucun échantillon utilisateur")
+        # Chargement du modèle (s'il a été entraîné avec les mêmes caractéristiques)
+        latest = read_latest()
+        if latest and latest.get('features') == FEATURES_VERSION:
+            model = joblib.load(os.path.join(MODEL_DIR, latest['file']))
+            model_version = checkpoint_version = max(latest['version'], model_version)
+            loaded = True
+            print(f"✅ Modèle chargé: {latest['file']}")
             
     except Exception as e:
         print(f"❌ Erreur chargement: {e}")
+    
+    if not loaded:
+        print("🆕 Création nouveau modèle...")
         create_model()
+        model_version += 1
+
+class IncrementalSpellModel:
+    """Modèle à apprentissage incrémental : normalisation puis régression logistique (SGD)
+    
+    partial_fit n'apprend que les échantillons donnés : ajouter k échantillons coûte O(k),
+    quel que soit l'historique. `seen` compte les échantillons utilisateur déjà traités (les
+    premiers du SampleStore), `compacted` ceux du dernier réentraînement complet et `updates`
+    les mises à jour depuis celui-ci.
+    
+    La normalisation est figée entre deux réentraînements complets : seul `fit` la recalcule.
+    Sinon chaque mise à jour déplacerait les entrées sous des poids appris avec l'ancienne
+    normalisation.
+    """
+    
+    def __init__(self, classes):
+        self.classes = list(classes)
+        self.scaler = StandardScaler()
+        self.classifier = SGDClassifier(loss="log_loss", alpha=1e-4, random_state=42)
+        self.seen = 0
+        self.compacted = 0
+        self.updates = 0
+    
+    @property
+    def classes_(self):
+        return self.classifier.classes_
+    
+    def fit(self, X, y, epochs=5):
+        """Entraînement complet (plusieurs passages mélangés sur toutes les données)"""
+        X, y = np.asarray(X, dtype=float), np.asarray(y)
+        self.scaler.fit(X)
+        X_scaled = self.scaler.transform(X)
+        rng = np.random.default_rng(42)
+        for _ in range(epochs):
+            order = rng.permutation(len(X))
+            self.classifier.partial_fit(X_scaled[order], y[order], classes=self.classes)
+        return self
+    
+    def partial_fit(self, X, y):
+        """Apprend seulement les nouveaux échantillons (normalisation inchangée)"""
+        X = np.asarray(X, dtype=float)
+        self.classifier.partial_fit(self.scaler.transform(X), y, classes=self.classes)
+        return self
+    
+    def predict(self, X):
+        return self.classifier.predict(self.scaler.transform(np.asarray(X, dtype=float)))
+    
+    def predict_proba(self, X):
+        return self.classifier.predict_proba(self.scaler.transform(np.asarray(X, dtype=float)))
+
+def synthetic_data(per_spell):
+    """Génère des échantillons de base pour chaque formule (enregistrements factices)"""
+    rng = np.random.default_rng()
+    y = [spell_name for spell_name in SPELLS.keys() for i in range(per_spell)]
+    X = extract_batch([synthetic_clip(spell_name, rng) for spell_name in y])
+    return X, y
+
+def training_data(count, excluded=()):
+    """Données d'un entraînement complet : les `count` premiers échantillons utilisateur, sauf
+    ceux d'indice `excluded`, + données de base"""
+    X_user, y_user = sample_store.rows(0, count)
+    if len(excluded):
+        X_user = np.delete(X_user, excluded, axis=0)
+        y_user = list(np.delete(np.array(y_user, dtype=object), excluded))
+    
+    # Ajout de données de base
+    X_base, y_base = synthetic_data(20)
+    if not y_user:
+        return X_base, y_base
+    return np.vstack([X_user, X_base]), y_user + y_base
 
 def create_model():
     """Crée le modèle initial"""
     global model
     
-    X, y = [], []
-    for spell_name in SPELLS.keys():
-        for i in range(50):
-            features = create_features(spell_name)
-            X.append(features)
-            y.append(spell_name)
+    X, y = synthetic_data(50)
     
-    model = RandomForestClassifier(n_estimators=100, random_state=42)
-    model.fit(X, y)
+    if TRAINING_MODE == "incremental":
+        model = IncrementalSpellModel(SPELLS.keys()).fit(X, y)
+    else:
+        model = RandomForestClassifier(n_estimators=100, random_state=42)
+        model.fit(X, y)
     print("✅ Modèle initial créé")
 
+def swap_model(new_model, message, checkpoint=False):
+    """Remplace le modèle d'un coup : une reconnaissance en cours garde un modèle complet
+    
+    Le modèle n'est écrit sur disque qu'aux points de sauvegarde (réentraînement complet ou
+    CHECKPOINT_EVERY versions depuis le dernier) : les échantillons, eux, le sont déjà.
+    """
+    global model, model_version
+    model = new_model
+    model_version += 1
+    print(f"✅ {message} (version {model_version})")
+    if checkpoint or model_version - checkpoint_version >= CHECKPOINT_EVERY:
+        checkpoint_model()
+
 def retrain_model():
     """Réentraîne le modèle avec les échantillons utilisateur"""
-    global model
+    if TRAINING_MODE == "incremental":
+        return update_model()
     
-    if not user_samples:
+    count = len(sample_store)
+    if not count:
         return
     
-    X, y = [], []
+    X, y = training_data(count)
+    new_model = RandomForestClassifier(n_estimators=150, random_state=42)
+    new_model.fit(X, y)
+    swap_model(new_model, f"Modèle réentraîné: {len(X)} échantillons", checkpoint=True)
+
+def holdout_indices(start, stop):
+    """Indices des échantillons de validation parmi [start, stop) : un sur HOLDOUT_EVERY"""
+    indices = np.arange(start, stop)
+    return indices[indices % HOLDOUT_EVERY == HOLDOUT_EVERY - 1]
+
+def update_model():
+    """Mode incrémental : apprend les échantillons arrivés depuis la dernière mise à jour
     
-    # Ajout des échantillons utilisateur
-    for spell_name, samples in user_samples.items():
-        for features in samples:
-            X.append(features)
-            y.append(spell_name)
+    Le modèle courant est copié (taille fixe) puis complété avec les k nouveaux échantillons,
+    sauf ceux de validation (voir HOLDOUT_EVERY). Toutes les COMPACT_EVERY mises à jour, ou si
+    le modèle n'est pas incrémental, le modèle est réentraîné en entier.
+    """
+    current = model
+    if not isinstance(current, IncrementalSpellModel) or current.updates >= COMPACT_EVERY:
+        return compact_model()
     
-    # Ajout de données de base
-    for spell_name in SPELLS.keys():
-        for i in range(20):
-            features = create_features(spell_name)
-            X.append(features)
-            y.append(spell_name)
-    
-    model = RandomForestClassifier(n_estimators=150, random_state=42)
-    model.fit(X, y)
-    print(f"✅ Modèle réentraîné: {len(X)} échantillons")
-    save_data()
-
-def predict_spell(filename):
-    """Prédit la formule magique"""
-    if model is None:
-        return None, 0.0
+    count = len(sample_store)
+    if count <= current.seen:
+        return
+    
+    X_new, y_new = sample_store.rows(current.seen, count)
+    learn = np.arange(current.seen, count) % HOLDOUT_EVERY != HOLDOUT_EVERY - 1
+    if not learn.any():
+        return
+    X_new, y_new = X_new[learn], [spell for spell, keep in zip(y_new, learn) if keep]
+    new_model = copy.deepcopy(current)
+    new_model.partial_fit(X_new, y_new)
+    new_model.seen = count
+    new_model.updates += 1
+    swap_model(new_model, f"Modèle mis à jour: {len(y_new)} nouvel(s) échantillon(s)")
+
+def compact_model():
+    """Réentraînement complet du modèle incrémental, avec mesure de la dérive
+    
+    La dérive est mesurée sur les échantillons de validation arrivés depuis le dernier
+    réentraînement complet (au plus DRIFT_SAMPLES), qu'aucun des deux modèles comparés n'a
+    appris : le modèle incrémental et un modèle refait sur les mêmes données que lui. L'écart
+    de précision est gardé dans `last_drift`. Le nouveau modèle apprend ensuite tout, y compris
+    les échantillons de validation.
+    """
+    global last_drift
+    
+    current = model
+    count = len(sample_store)
+    
+    incremental_accuracy = full_accuracy = None
+    holdout = []
+    if isinstance(current, IncrementalSpellModel):
+        holdout = holdout_indices(getattr(current, 'compacted', 0), current.seen)[-DRIFT_SAMPLES:]
+    if len(holdout):
+        X_rows, y_rows = sample_store.rows(0, current.seen)
+        X_eval, y_eval = X_rows[holdout], np.array(y_rows, dtype=object)[holdout]
+        reference = IncrementalSpellModel(SPELLS.keys()).fit(*training_data(current.seen, holdout))
+        incremental_accuracy = float(np.mean(current.predict(X_eval) == y_eval))
+        full_accuracy = float(np.mean(reference.predict(X_eval) == y_eval))
+    
+    X, y = training_data(count)
+    new_model = IncrementalSpellModel(SPELLS.keys()).fit(X, y)
+    new_model.seen = new_model.compacted = count
     
-    # Reconnaissance basée sur le nom du fichier
-    filename_lower = filename.lower()
+    last_drift = {
+        'date': datetime.now().isoformat(),
+        'updates': current.updates if isinstance(current, IncrementalSpellModel) else None,
+        'eval_samples': len(holdout),
+        'incremental_accuracy': incremental_accuracy,
+        'full_accuracy': full_accuracy,
+        'drift': None if incremental_accuracy is None else full_accuracy - incremental_accuracy
+    }
+    if incremental_accuracy is None:
+        print("📊 Dérive: aucun échantillon de validation depuis le dernier réentraînement complet")
+    else:
+        print(f"📊 Dérive sur {len(holdout)} échantillons de validation: précision incrémentale "
+              f"{incremental_accuracy:.3f}, complète {full_accuracy:.3f}")
+    swap_model(new_model, f"Modèle compacté: {len(X)} échantillons", checkpoint=True)
+
+def schedule_training(spell_name):
+    """Enregistre une tâche d'entraînement et réveille le thread d'entraînement"""
+    job_id = uuid.uuid4().hex[:12]
+    with jobs_lock:
+        training_jobs[job_id] = {
+            'id': job_id,
+            'spell': spell_name,
+            'status': 'en_attente',
+            'created': datetime.now().isoformat()
+        }
+        pending_jobs.append(job_id)
+        while len(training_jobs) > MAX_JOBS:
+            training_jobs.popitem(last=False)
+    train_requested.set()
+    return job_id
+
+def update_jobs(job_ids, **fields):
+    """Met à jour le statut de plusieurs tâches"""
+    with jobs_lock:
+        for job_id in job_ids:
+            if job_id in training_jobs:
+                training_jobs[job_id].update(fields)
+
+def training_worker():
+    """Thread d'entraînement : regroupe les tâches en attente en un seul réentraînement"""
+    while True:
+        train_requested.wait()
+        first_request = time.monotonic()
+        
+        # Attendre la fin de la rafale d'envois
+        while True:
+            train_requested.clear()
+            if not train_requested.wait(TRAIN_DEBOUNCE):
+                break
+            if time.monotonic() - first_request >= TRAIN_MAX_DELAY:
+                break
+        
+        with jobs_lock:
+            batch = list(pending_jobs)
+            pending_jobs.clear()
+        if not batch:
+            continue
+        
+        update_jobs(batch, status='en_cours', started=datetime.now().isoformat())
+        try:
+            retrain_model()
+        except Exception as e:
+            print(f"❌ Erreur réentraînement: {e}")
+            update_jobs(batch, status='erreur', error=str(e), finished=datetime.now().isoformat())
+        else:
+            update_jobs(batch, status='termine', model_version=model_version,
+                        finished=datetime.now().isoformat())
+
+def start_training_worker():
+    """Lance le thread d'entraînement en arrière-plan"""
+    threading.Thread(target=training_worker, name="entrainement", daemon=True).start()
+
+def rank_spells(current_model, X, top_k):
+    """Un seul predict_proba pour toutes les lignes : les top_k formules (nom, probabilité) de chacune"""
+    probabilities = current_model.predict_proba(X)
+    best = np.argsort(-probabilities, axis=1)[:, :top_k]
+    classes = current_model.classes_
+    return [[(str(classes[j]), float(row[j])) for j in order] for row, order in zip(probabilities, best)]
+
+def predict_spell(audio_data):
+    """Prédit la formule magique à partir des octets d'un fichier WAV"""
+    current_model = model
+    if current_model is None:
+        return None, 0.0
     
-    for spell_name in SPELLS.keys():
-        if spell_name.lower() in filename_lower:
-            return spell_name, 0.95
+    features = extract_features(audio_data)
+    return rank_spells(current_model, features[None, :], 1)[0][0]
+
+def batch_features(audio_files):
+    """Caractéristiques de plusieurs fichiers, BATCH_CHUNK à la fois : (matrice, {indice: erreur})
     
-    # Prédiction aléatoire si pas de correspondance
-    import random
-    spell = random.choice(list(SPELLS.keys()))
-    return spell, random.uniform(0.6, 0.9)
+    Un fichier illisible n'arrête pas le lot : sa ligne reste vide et son erreur est renvoyée.
+    """
+    X = np.zeros((len(audio_files), FEATURE_DIM), dtype=np.float32)
+    errors = {}
+    for start in range(0, len(audio_files), BATCH_CHUNK):
+        rows, signals = [], []
+        for i in range(start, min(start + BATCH_CHUNK, len(audio_files))):
+            try:
+                signals.append(decode_wav(audio_files[i].read()))
+                rows.append(i)
+            except AudioError as e:
+                errors[i] = str(e)
+        if signals:
+            X[rows] = extract_batch(signals)
+    return X, errors
 
 # Routes Flask
 @app.route('/')
@@ -186,7 +573,9 @@ def recognize_spell():
         if not audio_file.filename:
             return jsonify({'success': False, 'error': 'Aucun fichier sélectionné'}), 400
 
-        predicted_spell, confidence = predict_spell(audio_file.filename)
+        predicted_spell, confidence = predict_spell(audio_file.read())
+        if predicted_spell is None:
+            return jsonify({'success': False, 'error': 'Modèle non chargé'}), 503
         
         return jsonify({
             'success': True,
@@ -197,6 +586,60 @@ def recognize_spell():
             }
         })
 
+    except AudioError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/recognize/batch', methods=['POST'])
+def recognize_batch():
+    try:
+        audio_files = [f for f in request.files.getlist('audio') if f.filename]
+        if not audio_files:
+            return jsonify({'success': False, 'error': 'Aucun fichier audio'}), 400
+        if len(audio_files) > MAX_BATCH_FILES:
+            return jsonify({'success': False, 'error': f'{MAX_BATCH_FILES} fichiers au maximum'}), 413
+        
+        try:
+            top_k = int(request.values.get('top_k', TOP_K))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'top_k doit être un entier'}), 400
+        top_k = max(1, min(top_k, len(SPELLS)))
+        
+        current_model, version = model, model_version
+        if current_model is None:
+            return jsonify({'success': False, 'error': 'Modèle non chargé'}), 503
+        
+        X, errors = batch_features(audio_files)
+        valid = [i for i in range(len(audio_files)) if i not in errors]
+        rankings = dict(zip(valid, rank_spells(current_model, X[valid], top_k))) if valid else {}
+        
+        results = []
+        for i, audio_file in enumerate(audio_files):
+            if i in errors:
+                results.append({'index': i, 'filename': audio_file.filename, 'success': False, 'error': errors[i]})
+                continue
+            name, confidence = rankings[i][0]
+            results.append({
+                'index': i,
+                'filename': audio_file.filename,
+                'success': True,
+                'spell': {
+                    'name': name,
+                    'description': SPELLS.get(name, ''),
+                    'confidence': round(confidence * 100, 2)
+                },
+                'top': [{'name': spell, 'confidence': round(p * 100, 2)} for spell, p in rankings[i]]
+            })
+        
+        return jsonify({
+            'success': True,
+            'count': len(audio_files),
+            'recognized': len(valid),
+            'model_version': version,
+            'results': results
+        })
+
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -210,29 +653,56 @@ def train_with_sample():
         if 'audio' not in request.files:
             return jsonify({'success': False, 'error': 'Aucun fichier audio'}), 400
 
+        if spell_name not in SPELLS:
+            return jsonify({'success': False, 'error': 'Formule inconnue'}), 400
+
         audio_file = request.files['audio']
         print(f"🎓 Entraînement: {spell_name}")
         
-        # Création des caractéristiques
-        features = create_features(spell_name)
+        # Caractéristiques de l'enregistrement (décodé en mémoire)
+        features = extract_features(audio_file.read())
         
-        # Ajout à la base d'apprentissage
-        if spell_name not in user_samples:
-            user_samples[spell_name] = []
-        user_samples[spell_name].append(features)
+        # Ajout à la base d'apprentissage (écrit sur disque avant de répondre)
+        samples_count = sample_store.append(spell_name, features)
         
-        # Réentraînement
-        retrain_model()
+        # Réentraînement en arrière-plan
+        job_id = schedule_training(spell_name)
         
         return jsonify({
             'success': True,
-            'message': f'✅ {spell_name} ajouté! Modèle réentraîné.',
-            'samples_count': len(user_samples[spell_name])
-        })
+            'message': f'✅ {spell_name} ajouté! Réentraînement en arrière-plan.',
+            'samples_count': samples_count,
+            'job_id': job_id,
+            'status_url': f'/api/train/{job_id}'
+        }), 202
 
+    except AudioError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/train/<job_id>', methods=['GET'])
+def training_status(job_id):
+    with jobs_lock:
+        job = training_jobs.get(job_id)
+        job = dict(job) if job else None
+    if job is None:
+        return jsonify({'success': False, 'error': 'Tâche inconnue'}), 404
+    return jsonify({'success': True, 'job': job, 'model_version': model_version})
+
+@app.route('/api/model', methods=['GET'])
+def model_status():
+    current_model = model
+    return jsonify({
+        'success': True,
+        'mode': TRAINING_MODE,
+        'version': model_version,
+        'updates_since_compaction': getattr(current_model, 'updates', None),
+        'checkpoint_version': checkpoint_version,
+        'samples': len(sample_store),
+        'drift': last_drift
+    })
+
 @app.route('/api/spells', methods=['GET'])
 def get_spells():
     return jsonify({
@@ -243,7 +713,12 @@ def get_spells():
 if __name__ == '__main__':
     print("🏰 École de Magie Poudlard - IA de Reconnaissance Vocale")
     print("=" * 60)
-    load_data()
+    # En mode debug, le rechargeur de Werkzeug relance ce script dans un processus enfant : seul
+    # l'enfant (WERKZEUG_RUN_MAIN) sert les requêtes, charge le modèle, l'entraîne et le sauvegarde
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        load_data()
+        atexit.register(save_data)
+        start_training_worker()
     print("🚀 Serveur démarré: http://localhost:5000")
-    print("💾 Données sauvegardées automatiquement")
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    print("💾 Échantillons enregistrés à chaque ajout, modèle aux points de sauvegarde")
+    app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,224 @@
+# Caractéristiques audio des formules magiques (MFCC), partagées par l'entraînement et la reconnaissance
+#
+# Les octets d'un fichier WAV sont décodés en mémoire (PCM 8/16/24/32 bits ou flottant, mono ou
+# stéréo), ramenés à 16 kHz, découpés en trames de 25 ms (pas de 10 ms) puis transformés en
+# coefficients cepstraux (MFCC) : FFT, banc de filtres mel, logarithme, DCT. Les silences au début
+# et à la fin sont retirés. Chaque enregistrement donne un vecteur de FEATURE_DIM valeurs :
+# moyenne et écart type des MFCC et de leurs variations, durée parlée et débit d'énergie.
+#
+# extract_batch traite plusieurs enregistrements d'un coup : les trames de tous les fichiers sont
+# empilées dans une seule matrice, et la FFT, le banc de filtres et la DCT sont chacun un seul
+# calcul NumPy. Seules la lecture et le découpage bouclent, par fichier et non par trame.
+#
+# synthetic_clip génère un enregistrement factice par formule (sons purs et harmoniques, une
+# syllabe par voyelle) : données de base du modèle et jeu de test de benchmark_features.py.
+import struct
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+SAMPLE_RATE = 16000
+FRAME_LENGTH = 400      # 25 ms
+HOP_LENGTH = 160        # 10 ms
+N_FFT = 512
+N_MELS = 40
+N_MFCC = 13
+MIN_FREQ = 60.0
+MAX_FREQ = 7600.0
+PRE_EMPHASIS = 0.97
+SILENCE_DB = 40.0       # trames à plus de 40 dB sous la plus forte : silence
+MAX_SECONDS = 10.0
+
+FEATURES_VERSION = 1
+FEATURE_DIM = 4 * N_MFCC + 2
+
+
+class AudioError(ValueError):
+    """Fichier audio illisible ou format non pris en charge"""
+
+
+def mel_filterbank():
+    """Banc de filtres mel triangulaires (N_MELS x N_FFT/2+1)"""
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10 ** (mel / 2595.0) - 1.0)
+
+    edges = mel_to_hz(np.linspace(hz_to_mel(MIN_FREQ), hz_to_mel(MAX_FREQ), N_MELS + 2))
+    freqs = np.fft.rfftfreq(N_FFT, 1.0 / SAMPLE_RATE)
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (freqs - lower) / (center - lower)
+    falling = (upper - freqs) / (upper - center)
+    return np.maximum(0.0, np.minimum(rising, falling)).astype(np.float32)
+
+
+def dct_matrix():
+    """DCT-II orthonormée tronquée aux N_MFCC premiers coefficients (N_MELS x N_MFCC)"""
+    n = np.arange(N_MELS)
+    k = np.arange(N_MFCC)[:, None]
+    basis = np.cos(np.pi / N_MELS * (n + 0.5) * k) * np.sqrt(2.0 / N_MELS)
+    basis[0] /= np.sqrt(2.0)
+    return basis.T.astype(np.float32)
+
+
+# Calculés une seule fois : réutilisés par toutes les extractions
+WINDOW = np.hamming(FRAME_LENGTH).astype(np.float32)
+MEL_FILTERS = mel_filterbank()
+DCT = dct_matrix()
+
+
+def read_chunks(data):
+    """Blocs d'un fichier RIFF/WAVE : {identifiant: (début, taille)}"""
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise AudioError("Format audio non pris en charge (WAV attendu)")
+    chunks = {}
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id, size = struct.unpack_from("<4sI", data, offset)
+        chunks.setdefault(chunk_id, (offset + 8, min(size, len(data) - offset - 8)))
+        offset += 8 + size + (size & 1)
+    if b"fmt " not in chunks or b"data" not in chunks:
+        raise AudioError("Fichier WAV incomplet (blocs fmt ou data manquants)")
+    return chunks
+
+
+def decode_wav(data):
+    """Décode les octets d'un fichier WAV : signal mono float32 à SAMPLE_RATE Hz"""
+    data = bytes(data)
+    chunks = read_chunks(data)
+    fmt_start, fmt_size = chunks[b"fmt "]
+    if fmt_size < 16:
+        raise AudioError("Bloc fmt invalide")
+    audio_format, channels, rate, _, _, bits = struct.unpack_from("<HHIIHH", data, fmt_start)
+    if audio_format == 0xFFFE and fmt_size >= 26:
+        # WAVE_FORMAT_EXTENSIBLE : le vrai format est au début du sous-format
+        audio_format = struct.unpack_from("<H", data, fmt_start + 24)[0]
+    if channels == 0 or rate == 0 or bits not in (8, 16, 24, 32, 64):
+        raise AudioError(f"Format WAV non pris en charge ({channels} canaux, {rate} Hz, {bits} bits)")
+
+    start, size = chunks[b"data"]
+    size -= size % (bits // 8 * channels)
+    raw = np.frombuffer(data, dtype=np.uint8, count=size, offset=start)
+
+    if audio_format == 1 and bits == 8:
+        samples = (raw.astype(np.float32) - 128.0) / 128.0
+    elif audio_format == 1 and bits == 16:
+        samples = raw.view("<i2").astype(np.float32) / 32768.0
+    elif audio_format == 1 and bits == 24:
+        # 3 octets par échantillon : complétés à 4 octets (octet de poids faible nul)
+        padded = np.zeros((size // 3, 4), dtype=np.uint8)
+        padded[:, 1:] = raw.reshape(-1, 3)
+        samples = padded.view("<i4")[:, 0].astype(np.float32) / 2147483648.0
+    elif audio_format == 1 and bits == 32:
+        samples = raw.view("<i4").astype(np.float32) / 2147483648.0
+    elif audio_format == 3 and bits in (32, 64):
+        samples = raw.view("<f4" if bits == 32 else "<f8").astype(np.float32)
+    else:
+        raise AudioError(f"Format WAV non pris en charge (format {audio_format}, {bits} bits)")
+
+    signal = samples.reshape(-1, channels).mean(axis=1)
+    signal = signal[:int(MAX_SECONDS * rate)]
+    return resample(signal, rate)
+
+
+def resample(signal, rate):
+    """Rééchantillonne à SAMPLE_RATE Hz (interpolation linéaire)"""
+    if rate == SAMPLE_RATE or len(signal) == 0:
+        return signal.astype(np.float32)
+    duration = len(signal) / rate
+    times = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    return np.interp(times, np.arange(len(signal)) / rate, signal).astype(np.float32)
+
+
+def encode_wav(signal, rate=SAMPLE_RATE):
+    """Encode un signal float en WAV PCM 16 bits mono (octets)"""
+    pcm = (np.clip(signal, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+    header = struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + len(pcm), b"WAVE", b"fmt ", 16, 1, 1,
+                         rate, rate * 2, 2, 16, b"data", len(pcm))
+    return header + pcm
+
+
+def speech_frames(signal):
+    """Trames (vue sans copie) entre la première et la dernière trame non silencieuse"""
+    signal = np.asarray(signal, dtype=np.float32)
+    if len(signal) < FRAME_LENGTH + HOP_LENGTH:
+        signal = np.pad(signal, (0, FRAME_LENGTH + HOP_LENGTH - len(signal)))
+    frames = sliding_window_view(signal, FRAME_LENGTH)[::HOP_LENGTH]
+    energy = np.einsum("ij,ij->i", frames, frames)
+    loud = np.flatnonzero(energy > energy.max() * 10 ** (-SILENCE_DB / 10))
+    if len(loud) >= 2:
+        frames = frames[loud[0]:loud[-1] + 1]
+    return frames
+
+
+def extract_batch(signals):
+    """Caractéristiques de plusieurs signaux (SAMPLE_RATE Hz) : matrice len(signals) x FEATURE_DIM"""
+    if len(signals) == 0:
+        return np.empty((0, FEATURE_DIM), dtype=np.float32)
+    clips = [speech_frames(signal) for signal in signals]
+    counts = np.array([len(frames) for frames in clips])
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    frames = np.concatenate(clips)
+
+    # Toutes les trames de tous les fichiers d'un coup : préaccentuation, fenêtre, FFT, mel, DCT
+    frames = np.concatenate([frames[:, :1], frames[:, 1:] - PRE_EMPHASIS * frames[:, :-1]], axis=1)
+    power = np.abs(np.fft.rfft(frames * WINDOW, N_FFT)) ** 2 / N_FFT
+    log_mel = np.log(power @ MEL_FILTERS.T + 1e-10)
+    mfcc = (log_mel @ DCT).astype(np.float32)
+
+    # Variations d'une trame à la suivante (la dernière trame de chaque fichier n'en a pas)
+    delta = np.zeros_like(mfcc)
+    delta[:-1] = mfcc[1:] - mfcc[:-1]
+    delta[starts + counts - 1] = 0.0
+
+    def mean_std(values, n):
+        mean = np.add.reduceat(values, starts, axis=0) / n[:, None]
+        square = np.add.reduceat(values * values, starts, axis=0) / n[:, None]
+        return mean, np.sqrt(np.maximum(square - mean * mean, 0.0))
+
+    mfcc_mean, mfcc_std = mean_std(mfcc, counts)
+    delta_mean, delta_std = mean_std(delta, np.maximum(counts - 1, 1))
+    seconds = (counts * HOP_LENGTH + FRAME_LENGTH - HOP_LENGTH) / SAMPLE_RATE
+    energy_rate = np.add.reduceat(np.abs(delta[:, 0]), starts) / seconds
+    return np.hstack([mfcc_mean, mfcc_std, delta_mean, delta_std,
+                      np.log(seconds)[:, None], energy_rate[:, None]]).astype(np.float32)
+
+
+def extract_features(data):
+    """Caractéristiques d'un fichier WAV (octets) : vecteur de FEATURE_DIM valeurs"""
+    return extract_batch([decode_wav(data)])[0]
+
+
+def spell_syllables(spell_name):
+    """Syllabes approximatives d'une formule (groupes de voyelles)"""
+    vowels = "aeiouy"
+    word = spell_name.lower()
+    return max(1, sum(1 for i, c in enumerate(word) if c in vowels and (i == 0 or word[i - 1] not in vowels)))
+
+
+def synthetic_clip(spell_name, rng=None, rate=SAMPLE_RATE):
+    """Enregistrement factice d'une formule : une note par syllabe, avec harmoniques et bruit
+
+    La hauteur et le timbre dépendent de la formule, le nombre de notes de ses syllabes ;
+    tempo, hauteur, volume et bruit varient à chaque tirage.
+    """
+    rng = rng or np.random.default_rng()
+    code = sum(ord(c) for c in spell_name)
+    base = 140.0 + code % 160
+    harmonics = np.array([1.0, 0.6 + (code % 7) / 10, 0.3 + (code % 5) / 10, 0.2])
+
+    pieces = [np.zeros(int(rng.uniform(0.05, 0.2) * rate), dtype=np.float32)]
+    for i in range(spell_syllables(spell_name)):
+        seconds = rng.uniform(0.14, 0.22)
+        t = np.arange(int(seconds * rate)) / rate
+        pitch = base * (1.0 + 0.12 * ((code >> i) % 3)) * rng.uniform(0.95, 1.05)
+        tone = (harmonics[:, None] * np.sin(2 * np.pi * pitch * np.arange(1, 5)[:, None] * t)).sum(axis=0)
+        envelope = np.sin(np.pi * t / seconds) ** 2
+        pieces += [tone * envelope, np.zeros(int(rng.uniform(0.02, 0.06) * rate))]
+    pieces.append(np.zeros(int(rng.uniform(0.05, 0.2) * rate)))
+
+    signal = np.concatenate(pieces)
+    signal = signal / np.abs(signal).max() * rng.uniform(0.3, 0.9)
+    signal += rng.normal(0.0, rng.uniform(0.002, 0.02), len(signal))
+    return signal.astype(np.float32)
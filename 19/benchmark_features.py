@@ -0,0 +1,127 @@
+# Banc d'essai des caractéristiques audio, sur un jeu de test de sons synthétiques
+#
+# Exemples :
+#   python benchmark_features.py                       # 40 enregistrements par formule, objectif 200/s
+#   python benchmark_features.py --clips 100 --batch 64
+#   python benchmark_features.py --target 500 --json resultats.json
+#
+# Chaque formule a son enregistrement factice (audio_features.synthetic_clip), encodé en WAV
+# comme un envoi du navigateur. Le banc mesure le débit de l'extraction (décodage WAV compris)
+# fichier par fichier et par lots, sur un seul cœur, ainsi que le coût de la prédiction (un
+# predict_proba par fichier, comme /api/recognize, ou un seul pour tout le lot, comme
+# /api/recognize/batch). La précision du modèle incrémental est mesurée à part, sur un jeu fixe
+# (ACCURACY_CLIPS enregistrements par formule, graine ACCURACY_SEED) : entraîné sur une moitié,
+# évalué sur l'autre, elle ne dépend ni de --clips ni de --seed. Échec (code 1) si le débit par
+# lots est sous --target enregistrements/s ou la précision sous --min-accuracy.
+import os
+
+# Mesure sur un seul cœur (NumPy ne parallélise pas les produits matriciels). Les variables
+# sont lues au premier import de NumPy : les imports suivants restent donc après (noqa: E402)
+for variable in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(variable, "1")
+
+import sys  # noqa: E402
+import json  # noqa: E402
+import time  # noqa: E402
+import argparse  # noqa: E402
+
+import numpy as np  # noqa: E402
+
+from audio_features import SAMPLE_RATE, decode_wav, encode_wav, extract_batch, extract_features, synthetic_clip  # noqa: E402
+from app import SPELLS, IncrementalSpellModel  # noqa: E402
+
+# Jeu fixe de la mesure de précision : avec moins d'enregistrements, elle varie de plusieurs
+# points d'une graine à l'autre
+ACCURACY_CLIPS = 100
+ACCURACY_SEED = 0
+
+
+def make_test_set(clips_per_spell, seed=0):
+    """Jeu de test : (fichiers WAV, formules), mélangés"""
+    rng = np.random.default_rng(seed)
+    labels = [spell for spell in SPELLS for _ in range(clips_per_spell)]
+    wavs = [encode_wav(synthetic_clip(spell, rng)) for spell in labels]
+    order = rng.permutation(len(labels))
+    return [wavs[i] for i in order], [labels[i] for i in order]
+
+
+def throughput(function, items):
+    """Éléments traités par seconde"""
+    start = time.perf_counter()
+    function(items)
+    return len(items) / (time.perf_counter() - start)
+
+
+def accuracy(clips_per_spell=ACCURACY_CLIPS, seed=ACCURACY_SEED):
+    """Précision du modèle incrémental entraîné sur une moitié du jeu, évalué sur l'autre"""
+    wavs, labels = make_test_set(clips_per_spell, seed)
+    X = extract_batch([decode_wav(wav) for wav in wavs])
+    y = np.array(labels)
+    half = len(y) // 2
+    model = IncrementalSpellModel(SPELLS.keys()).fit(X[:half], y[:half])
+    return float(np.mean(model.predict(X[half:]) == y[half:]))
+
+
+def run_benchmark(clips_per_spell=40, batch=32, seed=0):
+    """Exécute le banc d'essai et renvoie le rapport"""
+    wavs, labels = make_test_set(clips_per_spell, seed)
+    seconds = sum(len(wav) - 44 for wav in wavs) / 2 / SAMPLE_RATE
+
+    single = throughput(lambda items: [extract_features(wav) for wav in items], wavs)
+    batched = throughput(lambda items: [extract_batch([decode_wav(wav) for wav in items[i:i + batch]])
+                                        for i in range(0, len(items), batch)], wavs)
+
+    X = extract_batch([decode_wav(wav) for wav in wavs])
+    model = IncrementalSpellModel(SPELLS.keys()).fit(X, np.array(labels))
+    predict_single = throughput(lambda rows: [model.predict_proba(row[None, :]) for row in rows], X)
+    predict_batched = throughput(model.predict_proba, X)
+
+    return {
+        "enregistrements": len(wavs),
+        "duree_moyenne": seconds / len(wavs),
+        "par_fichier": single,
+        "par_lots": batched,
+        "lot": batch,
+        "temps_reel": batched * seconds / len(wavs),
+        "precision": accuracy(),
+        "prediction_par_fichier": predict_single,
+        "prediction_par_lot": predict_batched,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai des caractéristiques audio (sons synthétiques)")
+    parser.add_argument("--clips", type=int, default=40, help="enregistrements par formule (défaut : 40)")
+    parser.add_argument("--batch", type=int, default=32, help="taille des lots (défaut : 32)")
+    parser.add_argument("--seed", type=int, default=0, help="graine du jeu de test (défaut : 0)")
+    parser.add_argument("--target", type=float, default=200.0,
+                        help="débit minimal par lots, en enregistrements/s (défaut : 200)")
+    parser.add_argument("--min-accuracy", type=float, default=0.9, help="précision minimale (défaut : 0.9)")
+    parser.add_argument("--json", help="fichier où enregistrer les mesures")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.clips, args.batch, args.seed)
+    print(f"{report['enregistrements']} enregistrements de {report['duree_moyenne']:.2f} s en moyenne")
+    print(f"Fichier par fichier : {report['par_fichier']:.0f} enregistrements/s")
+    print(f"Par lots de {report['lot']}     : {report['par_lots']:.0f} enregistrements/s "
+          f"({report['temps_reel']:.0f}x le temps réel)")
+    print(f"Précision (jeu fixe de {ACCURACY_CLIPS} par formule) : {report['precision']:.1%}")
+    print(f"Prédiction : {report['prediction_par_fichier']:.0f} enregistrements/s un par un, "
+          f"{report['prediction_par_lot']:.0f} en un seul appel")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    failures = []
+    if report["par_lots"] < args.target:
+        failures.append(f"débit : {report['par_lots']:.0f} enregistrements/s (objectif {args.target:.0f})")
+    if report["precision"] < args.min_accuracy:
+        failures.append(f"précision : {report['precision']:.1%} (minimum {args.min_accuracy:.0%})")
+    for line in failures:
+        print(f"Échec : {line}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+# Banc d'essai du pipeline d'analyse (script.py) sur un corpus de PDF synthétiques
+#
+# Exemples :
+#   python benchmark.py                                   # 7 livres de 300 pages, toutes les étapes
+#   python benchmark.py --books 20 --pages 500 extract count
+#   python benchmark.py --json resultats.json             # enregistre les mesures
+#   python benchmark.py --baseline resultats.json         # échoue si une étape régresse
+#
+# Chaque étape est mesurée séparément : temps (meilleur de --repeat passages), pic mémoire
+# Python (tracemalloc, passage à part pour ne pas fausser le temps) et débit en pages/s.
+# L'étape analyze chronomètre script.analyze_corpus de bout en bout (analyze_book, cache de
+# pages compris), cache vide (analyze_froid) puis cache rempli (analyze_chaud).
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+import script
+
+# Vocabulaire des livres synthétiques : du texte neutre, plus les mots que cherchent les statistiques
+FILLER_WORDS = ("le la les un une de du des et à dans sur pour avec il elle ils regarde dit "
+                "porte château couloir baguette livre table nuit soir élève professeur "
+                "silence escalier lettre hibou magie sort grand petit vieux").split()
+STAT_WORDS = ["Harry", "Harry", "Hermione", "Ron", "mais", "cicatrice", "Dumbledore décide",
+              "Rogue terrible", "vol", "attaque", "mensonge"]
+
+STAGES = ["extract", "count", "analyze", "dataframe", "plots"]
+
+# Fonction pour générer les lignes d'une page de texte synthétique
+def synthetic_page(rng, lines=40, words_per_line=11):
+    page = []
+    for _ in range(lines):
+        words = [rng.choice(STAT_WORDS) if rng.random() < 0.08 else rng.choice(FILLER_WORDS)
+                 for _ in range(words_per_line)]
+        page.append(" ".join(words))
+    return page
+
+# Fonction pour échapper une chaîne de texte PDF (encodage WinAnsi, proche du latin-1)
+def pdf_string(text):
+    data = text.encode("latin-1", errors="replace")
+    return data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+# Fonction pour écrire un PDF minimal (une police standard, une ligne de texte par ligne de page)
+def write_pdf(path, pages):
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(pages)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    for page_id, lines in zip(page_ids, pages):
+        stream = b"BT /F1 10 Tf 12 TL 40 800 Td\n"
+        stream += b"".join(b"(" + pdf_string(line) + b") Tj T*\n" for line in lines) + b"ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode())
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+# Fonction pour générer un corpus de livres synthétiques dans un dossier
+def generate_corpus(folder, books=7, pages=300, seed=0):
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    for i in range(books):
+        write_pdf(os.path.join(folder, f"HP{i + 1}.pdf"), [synthetic_page(rng) for _ in range(pages)])
+    return script.list_pdf_files(folder)
+
+# Fonction pour mesurer une étape : meilleur temps sur `repeat` passages, puis pic mémoire sur un passage
+# (setup, s'il est donné, s'exécute avant chaque passage, hors chronomètre)
+def measure(function, repeat, with_memory, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    peak = None
+    if with_memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, min(timings), peak
+
+# Fonction pour exécuter le banc d'essai et renvoyer les mesures de chaque étape
+def run_benchmark(pdf_files, stages, repeat=3, with_memory=True, plot_folder=None):
+    n_pages = None
+    pages_by_book = None
+    results = None
+    df = None
+    report = {}
+
+    def record(stage, function, setup=None):
+        result, seconds, peak = measure(function, repeat, with_memory, setup)
+        report[stage] = {"secondes": seconds, "pic_memoire_mo": None if peak is None else peak / 1e6,
+                         "pages_par_seconde": n_pages / seconds if seconds else None}
+        return result
+
+    # Extraction : lecture des PDF sans le cache disque
+    pages_by_book = [list(script.iter_pdf_pages(pdf)) for pdf in pdf_files]
+    n_pages = sum(len(pages) for pages in pages_by_book)
+    if "extract" in stages:
+        record("extract", lambda: [sum(1 for _ in script.iter_pdf_pages(pdf)) for pdf in pdf_files])
+
+    # Comptage : toutes les statistiques, page par page, sur le texte déjà extrait
+    def count():
+        out = []
+        for i, pages in enumerate(pages_by_book):
+            page_counts = [list(script.count_stats(script.STAT_SET, page).values()) for page in pages]
+            out.append((script.book_stats(f"HP{i + 1}", len(page_counts), script.page_totals(page_counts)),
+                        page_counts))
+        return out
+    results = count()
+    if "count" in stages:
+        record("count", count)
+
+    # Analyse complète (analyze_corpus -> analyze_book -> iter_pages), avec un cache de pages
+    # temporaire : vidé avant chaque passage, puis rempli
+    if "analyze" in stages:
+        cache_folder = script.cache_folder
+        script.cache_folder = tempfile.mkdtemp(prefix="bench_cache_")
+        try:
+            record("analyze_froid", lambda: script.analyze_corpus(pdf_files),
+                   setup=lambda: shutil.rmtree(script.cache_folder, ignore_errors=True))
+            script.analyze_corpus(pdf_files)
+            record("analyze_chaud", lambda: script.analyze_corpus(pdf_files))
+        finally:
+            shutil.rmtree(script.cache_folder, ignore_errors=True)
+            script.cache_folder = cache_folder
+
+    # Construction des DataFrames
+    df, _ = script.stats_dataframes(results)
+    if "dataframe" in stages:
+        record("dataframe", lambda: script.stats_dataframes(results))
+
+    # Graphiques, dessinés dans un dossier temporaire (supprimé ensuite) si aucun n'est donné
+    if "plots" in stages:
+        temporary = plot_folder is None
+        plot_folder = plot_folder or tempfile.mkdtemp(prefix="bench_plots_")
+        try:
+            plots = [dict(plot, fichier=os.path.join(plot_folder, os.path.basename(plot["fichier"])))
+                     for plot in script.PLOTS]
+            script.setup_plotting()
+            record("plots", lambda: [script.render_plot(df.set_index("Livre")[plot["colonnes"]], plot)
+                                     for plot in plots])
+        finally:
+            if temporary:
+                shutil.rmtree(plot_folder, ignore_errors=True)
+
+    return {"livres": len(pdf_files), "pages": n_pages, "etapes": report}
+
+# Fonction pour afficher les mesures sous forme de tableau
+def print_report(report):
+    print(f"Corpus : {report['livres']} livre(s), {report['pages']} pages")
+    print(f"{'étape':<14} {'temps (s)':>10} {'pic mémoire (Mo)':>17} {'pages/s':>10}")
+    for stage, values in report["etapes"].items():
+        peak = "-" if values["pic_memoire_mo"] is None else f"{values['pic_memoire_mo']:.1f}"
+        rate = "-" if values["pages_par_seconde"] is None else f"{values['pages_par_seconde']:.0f}"
+        print(f"{stage:<14} {values['secondes']:>10.3f} {peak:>17} {rate:>10}")
+
+# Fonction pour comparer les mesures à une référence : renvoie les étapes plus lentes que la tolérance
+def regressions(report, baseline, tolerance):
+    slower = []
+    for stage, values in report["etapes"].items():
+        reference = baseline["etapes"].get(stage)
+        if not reference or values["pages_par_seconde"] is None or reference["pages_par_seconde"] is None:
+            continue
+        if values["pages_par_seconde"] < reference["pages_par_seconde"] * (1 - tolerance):
+            slower.append(f"{stage} : {values['pages_par_seconde']:.0f} pages/s "
+                          f"(référence {reference['pages_par_seconde']:.0f})")
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai du pipeline d'analyse des livres")
+    parser.add_argument("stages", nargs="*", metavar="etape",
+                        help=f"étapes à mesurer parmi {', '.join(STAGES)} ; par défaut toutes")
+    parser.add_argument("--books", type=int, default=7, help="nombre de livres synthétiques (défaut : 7)")
+    parser.add_argument("--pages", type=int, default=300, help="pages par livre (défaut : 300)")
+    parser.add_argument("--seed", type=int, default=0, help="graine du générateur de texte (défaut : 0)")
+    parser.add_argument("--repeat", type=int, default=3, help="passages par étape, le meilleur est gardé (défaut : 3)")
+    parser.add_argument("--no-memory", action="store_true", help="ne pas mesurer le pic mémoire")
+    parser.add_argument("--corpus", help="dossier du corpus (généré s'il est vide ; temporaire par défaut)")
+    parser.add_argument("--json", help="fichier où enregistrer les mesures")
+    parser.add_argument("--baseline", help="mesures de référence (JSON) : échec si une étape régresse")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="baisse de débit tolérée par rapport à la référence (défaut : 0.2)")
+    args = parser.parse_args()
+    stages = args.stages or STAGES
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"étape inconnue : {', '.join(sorted(unknown))} (choix : {', '.join(STAGES)})")
+
+    # Sans --corpus, le corpus est généré dans un dossier temporaire, supprimé à la fin
+    folder = args.corpus or tempfile.mkdtemp(prefix="bench_corpus_")
+    try:
+        pdf_files = script.list_pdf_files(folder) if os.path.isdir(folder) else []
+        if not pdf_files:
+            pdf_files = generate_corpus(folder, args.books, args.pages, args.seed)
+
+        report = run_benchmark(pdf_files, stages, repeat=args.repeat, with_memory=not args.no_memory)
+        print_report(report)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+        if args.baseline:
+            with open(args.baseline, encoding="utf-8") as f:
+                slower = regressions(report, json.load(f), args.tolerance)
+            for line in slower:
+                print(f"Régression : {line}")
+            if slower:
+                sys.exit(1)
+    finally:
+        if not args.corpus:
+            shutil.rmtree(folder, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -1,142 +1,754 @@
 # Import des bibliothèques
 import os
 import re
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import gzip
+import json
+import shutil
+import hashlib
+import argparse
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import PyPDF2
 from PyPDF2 import PdfReader
 
-# Configuration de Seaborn pour les graphes
-sns.set(style="whitegrid")
+# pandas, matplotlib et seaborn ne sont importés que par les étapes qui s'en servent
+# (voir stats_dataframes et setup_plotting) : une étape "extract" ou "stats" démarre sans eux.
 
 # Dossier contenant les PDF
 pdf_folder = "./data"
 
+# Dossier du cache de texte extrait (une entrée par contenu de PDF et version de PyPDF2)
+cache_folder = "./.cache"
+
 # Fonction pour lister tous les fichiers PDF dans le dossier
+# (triés par nom pour que HP1..HPn ne dépendent pas de l'ordre de os.listdir)
 def list_pdf_files(folder):
-    return [os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".pdf")]
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".pdf"))
+
+# Fonction pour calculer l'empreinte SHA-256 du contenu d'un fichier
+def file_hash(file_path):
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
 
-# Fonction pour extraire le texte d'un PDF
-def extract_text_from_pdf(file_path):
-    text = ""
+# Générateur qui extrait le texte d'un PDF page par page (une seule lecture du fichier)
+def iter_pdf_pages(file_path):
     with open(file_path, "rb") as f:
         reader = PdfReader(f)
         for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-    return text
-
-# Fonction pour compter les occurrences avec regex (insensible à la casse)
-def count_occurrences(text, pattern):
-    return len(re.findall(pattern, text, re.IGNORECASE))
-
-# Fonction pour diviser le texte par pages
-def split_text_pages(pdf_path):
-    with open(pdf_path, "rb") as f:
-        reader = PdfReader(f)
-        pages_text = [page.extract_text() for page in reader.pages]
-    return pages_text
+            yield page.extract_text() or ""
+
+# Générateur des pages d'un PDF en passant par le cache disque
+# La clé dépend du contenu du fichier et de la version de PyPDF2 : un PDF modifié
+# ou une mise à jour de l'extracteur invalide automatiquement l'entrée.
+# Le cache est un fichier JSON Lines compressé (une page par ligne) : il se relit et
+# s'écrit au fil de l'eau, sans jamais garder le livre entier en mémoire.
+def iter_pages(pdf_path):
+    key = f"{file_hash(pdf_path)}-{PyPDF2.__version__}"
+    cache_path = os.path.join(cache_folder, key + ".jsonl.gz")
+    if os.path.exists(cache_path):
+        with gzip.open(cache_path, "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+        return
+
+    # Écriture atomique : un fichier temporaire, renommé seulement si toutes les pages ont été lues
+    os.makedirs(cache_folder, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    complete = False
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for page_text in iter_pdf_pages(pdf_path):
+                f.write(json.dumps(page_text, ensure_ascii=False) + "\n")
+                yield page_text
+        complete = True
+    finally:
+        if complete:
+            os.replace(tmp_path, cache_path)
+        elif os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+# ----------------------------
+# Définition des statistiques
+# ----------------------------
+# Chaque statistique est décrite de façon déclarative (insensible à la casse) :
+# - "mots" : mots entiers, équivalent à \b(mot1|mot2)\b
+# - "fragments" : sous-chaînes n'importe où dans le texte, équivalent à frag1|frag2
+# - "sujet" + "cibles" : lignes où le sujet est suivi d'une des cibles,
+#   équivalent à sujet.*(cible1|cible2) (au plus une occurrence par ligne)
+# "par_100_pages" ajoute la colonne normalisée correspondante.
+STATS = [
+    {"nom": "Harry_cicatrice", "mots": ["cicatrice"], "par_100_pages": True},
+    {"nom": "Hermione_mais", "mots": ["mais"], "par_100_pages": True},
+    {"nom": "Dumbledore_interfere", "sujet": "Dumbledore",
+     "cibles": ["décide", "change", "intervient", "ordonne", "influence", "tourne et retourne"],
+     "par_100_pages": True},
+    {"nom": "Rogue_dark", "sujet": "Rogue",
+     "cibles": ["mystérieux", "dark", "méchant", "terrible"], "par_100_pages": True},
+    {"nom": "Harry_speak", "mots": ["Harry"]},
+    {"nom": "Hermione_speak", "mots": ["Hermione"]},
+    {"nom": "Ron_speak", "mots": ["Ron"]},
+    {"nom": "Actes_illicites", "fragments": ["vol", "tricherie", "mensonge", "meurtre", "attaque", "poison"],
+     "par_100_pages": True},
+]
+
+# Fonction pour lister les chaînes littérales recherchées par une statistique
+def stat_literals(stat):
+    return [lit.lower() for lit in stat.get("mots", []) + stat.get("fragments", [])
+            + ([stat["sujet"]] if "sujet" in stat else []) + stat.get("cibles", [])]
 
-# Fonction principale pour analyser un texte de livre
+# Fonction pour savoir si deux statistiques peuvent partager le même balayage
+# Le balayage fusionné teste toutes les positions du texte mais ne retient qu'une alternative
+# par position : deux littéraux dont l'un est le préfixe de l'autre ne peuvent pas cohabiter.
+def stats_conflict(stat_a, stat_b):
+    return any(a.startswith(b) or b.startswith(a)
+               for a in stat_literals(stat_a) for b in stat_literals(stat_b))
+
+# Fonction pour compiler un groupe de statistiques en une seule regex à groupes nommés
+# Chaque alternative est une assertion avant (?=...) : les correspondances de deux statistiques
+# différentes peuvent se chevaucher sans se masquer. Les littéraux sont mis en minuscules
+# (le texte l'est aussi au comptage) plutôt que d'utiliser re.IGNORECASE, et un filtre sur le
+# premier caractère écarte vite les positions qui ne peuvent rien donner.
+def compile_stat_group(group):
+    parts = []
+    has_lines = False
+    for i, stat in enumerate(group):
+        if "mots" in stat:
+            parts.append(rf"(?P<m{i}>\b(?:{'|'.join(re.escape(w.lower()) for w in stat['mots'])})\b)")
+        elif "fragments" in stat:
+            parts.append(f"(?P<m{i}>{'|'.join(re.escape(f.lower()) for f in stat['fragments'])})")
+        else:
+            # Le sujet et ses cibles sont repérés séparément puis combinés ligne par ligne,
+            # ce qui évite le retour arrière du motif "sujet.*(cibles)" sur les longues lignes.
+            parts.append(f"(?P<s{i}>{re.escape(stat['sujet'].lower())})")
+            parts.append(f"(?P<c{i}>{'|'.join(re.escape(c.lower()) for c in stat['cibles'])})")
+            has_lines = True
+    first_chars = {lit[0] for stat in group for lit in stat_literals(stat)}
+    if has_lines:
+        parts.append(r"(?P<nl>\n)")
+        first_chars.add("\n")
+    prefilter = "[" + "".join(re.escape(c) for c in sorted(first_chars)) + "]"
+    pattern = f"(?={prefilter})(?=" + "|".join(parts) + ")"
+    return {"regex": re.compile(pattern), "stats": group}
+
+# Fonction pour compiler l'ensemble des statistiques
+# Les statistiques compatibles sont fusionnées dans le même balayage :
+# avec la configuration actuelle, tout le livre est parcouru une seule fois.
+def compile_stat_set(stats):
+    groups = []
+    for stat in stats:
+        # Un sujet préfixe d'une de ses cibles (ou l'inverse) se masquerait lui-même dans le balayage
+        if "sujet" in stat and stats_conflict({"mots": [stat["sujet"]]}, {"mots": stat["cibles"]}):
+            raise ValueError(f"{stat['nom']} : le sujet et une cible commencent par le même texte")
+        for group in groups:
+            if not any(stats_conflict(stat, other) for other in group):
+                group.append(stat)
+                break
+        else:
+            groups.append([stat])
+    return {"stats": list(stats), "groups": [compile_stat_group(group) for group in groups]}
+
+# Fonction pour compter toutes les statistiques d'un texte, sans construire de liste de correspondances
+# Reproduit exactement re.findall statistique par statistique :
+# - "mots"/"fragments" : correspondances sans chevauchement, de gauche à droite
+# - "sujet"/"cibles" : une ligne compte si une cible commence après la fin du premier sujet
+def count_stats(stat_set, text):
+    text = text.lower()
+    counts = {}
+    for group in stat_set["groups"]:
+        stats = group["stats"]
+        group_counts = [0] * len(stats)
+        next_start = [0] * len(stats)
+        subject_end = [None] * len(stats)
+        line_counted = [False] * len(stats)
+        for match in group["regex"].finditer(text):
+            name = match.lastgroup
+            if name == "nl":
+                subject_end = [None] * len(stats)
+                line_counted = [False] * len(stats)
+                continue
+            kind, i = name[0], int(name[1:])
+            start = match.start()
+            if kind == "m":
+                if start >= next_start[i]:
+                    group_counts[i] += 1
+                    next_start[i] = match.end(name)
+            elif kind == "s":
+                if subject_end[i] is None:
+                    subject_end[i] = match.end(name)
+            elif subject_end[i] is not None and start >= subject_end[i] and not line_counted[i]:
+                group_counts[i] += 1
+                line_counted[i] = True
+        counts.update((stat["nom"], n) for stat, n in zip(stats, group_counts))
+    # Ordre des colonnes identique à l'ordre de déclaration
+    return {stat["nom"]: counts[stat["nom"]] for stat in stat_set["stats"]}
+
+# Ensemble compilé une fois au chargement du module (aussi dans chaque processus de travail)
+STAT_SET = compile_stat_set(STATS)
+
+# Générateur des comptes page par page : chaque page est comptée dès qu'elle est extraite
+# Les pages sont séparées par des sauts de ligne dans le texte complet, donc la somme
+# des comptes par page est égale au compte sur le livre entier.
+def iter_page_counts(pdf_path, stat_set=STAT_SET):
+    for page_text in iter_pages(pdf_path):
+        yield count_stats(stat_set, page_text)
+
+# Fonction pour compter une liste de statistiques page par page dans un livre
+# Renvoie une liste de valeurs par page, dans l'ordre de stats. La mémoire utilisée
+# ne dépend pas de la taille du livre, hormis ces quelques entiers par page.
+def count_book_pages(pdf_path, stats=STATS):
+    stat_set = STAT_SET if stats is STATS else compile_stat_set(stats)
+    return [list(page_stats.values()) for page_stats in iter_page_counts(pdf_path, stat_set)]
+
+# Fonction pour additionner les comptes par page de chaque statistique
+def page_totals(page_counts, stats=STATS):
+    return {stat["nom"]: sum(counts[i] for counts in page_counts) for i, stat in enumerate(stats)}
+
+# Fonction principale pour analyser un livre
+# Renvoie les statistiques globales et les comptes par page
 def analyze_book(pdf_path, book_name):
-    text = extract_text_from_pdf(pdf_path)
-    pages_text = split_text_pages(pdf_path)
-    n_pages = len(pages_text)
-    
+    page_counts = count_book_pages(pdf_path)
+    return book_stats(book_name, len(page_counts), page_totals(page_counts)), page_counts
+
+# Fonction pour construire la ligne de statistiques d'un livre à partir des totaux
+def book_stats(book_name, n_pages, totals):
     # Comptage global
     stats = {
         "Livre": book_name,
         "Pages": n_pages,
-        "Harry_cicatrice": count_occurrences(text, r"\bcicatrice\b"),
-        "Hermione_mais": count_occurrences(text, r"\bmais\b"),
-        "Dumbledore_interfere": count_occurrences(text, r"Dumbledore.*(décide|change|intervient|ordonne|influence|tourne et retourne)"),
-        "Rogue_dark": count_occurrences(text, r"Rogue.*(mystérieux|dark|méchant|terrible)"),
-        "Harry_speak": count_occurrences(text, r"\bHarry\b"),
-        "Hermione_speak": count_occurrences(text, r"\bHermione\b"),
-        "Ron_speak": count_occurrences(text, r"\bRon\b"),
-        "Actes_illicites": count_occurrences(text, r"vol|tricherie|mensonge|meurtre|attaque|poison")
     }
+    stats.update(totals)
     
     # Normalisation par 100 pages
-    for key in ["Harry_cicatrice", "Hermione_mais", "Dumbledore_interfere", "Rogue_dark", "Actes_illicites"]:
-        stats[f"{key}_par_100_pages"] = stats[key] / n_pages * 100
+    for stat in STATS:
+        if stat.get("par_100_pages"):
+            stats[f"{stat['nom']}_par_100_pages"] = stats[stat["nom"]] / n_pages * 100
     
     return stats
 
-# Parcours de tous les fichiers PDF et création du DataFrame
-pdf_files = list_pdf_files(pdf_folder)
-stats_list = []
+# ----------------------------
+# Index positionnel
+# ----------------------------
+# Chaque livre est découpé une seule fois en mots (\w+, en minuscules). Pour chaque terme,
+# l'index garde la liste de ses occurrences : page, ligne et position du mot dans le livre.
+# Les occurrences sont rangées par terme (format CSR : ptr[i]:ptr[i+1] pour le terme i)
+# et stockées en fichiers .npy relus en mémoire partagée (mmap), sans coût d'analyse.
+
+# Dossier des index (un sous-dossier par contenu de PDF, version de PyPDF2 et d'index)
+index_folder = "./index"
+INDEX_VERSION = 1
+TOKEN_RE = re.compile(r"\w+")
+INDEX_ARRAYS = ["ptr", "page", "line", "pos"]
+EMPTY = np.empty(0, dtype=np.int32)
+
+# Fonction pour construire l'index positionnel d'un livre, page par page
+def build_index(pdf_path):
+    vocab = {}
+    term_ids, pages, lines, positions = (array("i") for _ in range(4))
+    n_pages = n_lines = n_tokens = 0
+    for page_no, page_text in enumerate(iter_pages(pdf_path)):
+        for line in page_text.lower().split("\n"):
+            for token in TOKEN_RE.findall(line):
+                term_ids.append(vocab.setdefault(token, len(vocab)))
+                pages.append(page_no)
+                lines.append(n_lines)
+                positions.append(n_tokens)
+                n_tokens += 1
+            n_lines += 1
+        n_pages = page_no + 1
+
+    # Regroupement des occurrences par terme (le tri stable garde l'ordre de lecture)
+    term_ids = np.frombuffer(term_ids, dtype=np.int32)
+    order = np.argsort(term_ids, kind="stable")
+    ptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=ptr[1:])
+    index = {
+        "terms": list(vocab),
+        "ptr": ptr,
+        "page": np.frombuffer(pages, dtype=np.int32)[order],
+        "line": np.frombuffer(lines, dtype=np.int32)[order],
+        "pos": np.frombuffer(positions, dtype=np.int32)[order],
+        "n_pages": n_pages,
+        "n_tokens": n_tokens,
+    }
+    return with_vocab_lookup(index)
+
+# Fonction pour ajouter les tables de recherche du vocabulaire (non stockées sur disque)
+# Le vocabulaire est aussi concaténé en une seule chaîne pour trouver d'un coup
+# tous les termes qui contiennent un fragment.
+def with_vocab_lookup(index):
+    index["vocab"] = {term: i for i, term in enumerate(index["terms"])}
+    index["vocab_text"] = "\n".join(index["terms"]) + "\n"
+    index["vocab_starts"] = np.cumsum([0] + [len(term) + 1 for term in index["terms"]])
+    return index
+
+# Fonction pour enregistrer un index dans un dossier (écriture atomique par renommage du dossier)
+def save_index(index, index_path):
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    os.makedirs(tmp_path, exist_ok=True)
+    for name in INDEX_ARRAYS:
+        np.save(os.path.join(tmp_path, f"{name}.npy"), index[name])
+    with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"terms": index["terms"], "n_pages": index["n_pages"],
+                   "n_tokens": index["n_tokens"]}, f, ensure_ascii=False)
+    try:
+        os.replace(tmp_path, index_path)
+    except OSError:
+        # Un autre processus a écrit le même index entre-temps
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+# Fonction pour relire un index enregistré (tableaux en mmap, chargés à la demande)
+def load_index(index_path):
+    with open(os.path.join(index_path, "meta.json"), encoding="utf-8") as f:
+        index = json.load(f)
+    for name in INDEX_ARRAYS:
+        index[name] = np.load(os.path.join(index_path, f"{name}.npy"), mmap_mode="r")
+    return with_vocab_lookup(index)
+
+# Fonction pour obtenir l'index d'un PDF : relu s'il existe, construit et enregistré sinon
+def get_index(pdf_path):
+    key = f"{file_hash(pdf_path)}-{PyPDF2.__version__}-{INDEX_VERSION}"
+    index_path = os.path.join(index_folder, key)
+    if not os.path.exists(index_path):
+        os.makedirs(index_folder, exist_ok=True)
+        save_index(build_index(pdf_path), index_path)
+    return load_index(index_path)
+
+# Fonction pour récupérer les occurrences (positions, pages, lignes) d'un terme ou d'une
+# expression de plusieurs mots, triées dans l'ordre de lecture
+def term_occurrences(index, term):
+    tokens = TOKEN_RE.findall(term.lower())
+    return phrase_occurrences([term_postings(index, [index["vocab"].get(token)]) for token in tokens])
+
+# Fonction pour récupérer les occurrences réunies d'une liste d'identifiants de termes
+# (les identifiants None, pour un terme absent du livre, sont ignorés)
+def term_postings(index, term_ids):
+    ptr = index["ptr"]
+    slices = [slice(ptr[i], ptr[i + 1]) for i in term_ids if i is not None]
+    pos, page, line = (np.concatenate([index[name][s] for s in slices] or [EMPTY])
+                       for name in ["pos", "page", "line"])
+    order = np.argsort(pos, kind="stable")
+    return pos[order], page[order], line[order]
+
+# Fonction pour garder les occurrences où chaque mot de l'expression suit le précédent
+# (mots consécutifs sur la même ligne). Renvoie les occurrences du premier mot.
+def phrase_occurrences(postings):
+    if not postings:
+        return EMPTY, EMPTY, EMPTY
+    pos, page, line = postings[0]
+    keep = np.ones(len(pos), dtype=bool)
+    for offset, (next_pos, _, next_line) in enumerate(postings[1:], start=1):
+        if not len(next_pos):
+            return EMPTY, EMPTY, EMPTY
+        idx = np.minimum(np.searchsorted(next_pos, pos + offset), len(next_pos) - 1)
+        keep &= (next_pos[idx] == pos + offset) & (next_line[idx] == line)
+    return pos[keep], page[keep], line[keep]
+
+# Fonction pour compter les occurrences d'un terme (ou d'une expression) dans un livre
+def term_count(index, term):
+    return len(term_occurrences(index, term)[0])
+
+# Fonction pour obtenir le nombre d'occurrences d'un terme page par page
+def page_frequency(index, term):
+    return np.bincount(term_occurrences(index, term)[1], minlength=index["n_pages"])
+
+# Fonction pour compter les occurrences de term_a qui ont au moins une occurrence
+# de term_b à `window` mots ou moins (avant ou après)
+def proximity_count(index, term_a, term_b, window):
+    pos_a = term_occurrences(index, term_a)[0]
+    pos_b = term_occurrences(index, term_b)[0]
+    n_near = np.searchsorted(pos_b, pos_a + window, side="right") - np.searchsorted(pos_b, pos_a - window)
+    if TOKEN_RE.findall(term_a.lower()) == TOKEN_RE.findall(term_b.lower()):
+        n_near -= 1  # l'occurrence elle-même ne compte pas
+    return int(np.count_nonzero(n_near > 0))
+
+# Fonction pour trouver les termes du vocabulaire qui correspondent à une regex (sans saut de ligne),
+# avec le nombre de correspondances sans chevauchement dans chacun d'eux
+def matching_terms(index, regex):
+    starts = np.fromiter((m.start() for m in regex.finditer(index["vocab_text"])), dtype=np.int64)
+    return np.unique(np.searchsorted(index["vocab_starts"], starts, side="right") - 1, return_counts=True)
+
+# Fonction pour récupérer les occurrences des termes qui contiennent un fragment
+# (anchor="start" : termes qui commencent par le fragment, anchor="end" : qui finissent par lui)
+def fragment_postings(index, fragment, anchor=None):
+    pattern = re.escape(fragment.lower())
+    if anchor == "start":
+        pattern = "^" + pattern
+    elif anchor == "end":
+        pattern += "$"
+    term_ids, _ = matching_terms(index, re.compile(pattern, re.MULTILINE))
+    return term_postings(index, term_ids.tolist())
+
+# Fonction pour calculer, à partir de l'index, la page de chaque occurrence comptée d'une statistique
+# (même définition que count_stats : le total est la longueur du tableau renvoyé)
+# Pour "sujet"/"cibles", l'index travaille au niveau des mots : une cible collée au sujet dans
+# le même mot ou séparée par autre chose qu'une espace simple est traitée comme un mot à part.
+def stat_pages_from_index(index, stat):
+    if "mots" in stat:
+        return np.concatenate([term_occurrences(index, word)[1] for word in stat["mots"]])
+    if "fragments" in stat:
+        regex = re.compile("|".join(re.escape(f.lower()) for f in stat["fragments"]))
+        term_ids, n_matches = matching_terms(index, regex)
+        ptr = index["ptr"]
+        return np.concatenate([np.repeat(index["page"][ptr[i]:ptr[i + 1]], n)
+                               for i, n in zip(term_ids, n_matches)] or [EMPTY])
 
-for i, pdf in enumerate(pdf_files):
-    book_name = f"HP{i+1}"
-    stats_list.append(analyze_book(pdf, book_name))
+    # Premier sujet de chaque ligne
+    subj_pos, subj_page, subj_line = fragment_postings(index, stat["sujet"])
+    lines, first = np.unique(subj_line, return_index=True)
+    first_pos, first_page = subj_pos[first], subj_page[first]
 
-df = pd.DataFrame(stats_list)
+    # Cibles : un mot contenant la cible, ou une expression dont le premier mot finit
+    # par le début de la cible et le dernier mot commence par sa fin
+    target_pos, target_line = [], []
+    for target in stat["cibles"]:
+        tokens = TOKEN_RE.findall(target.lower())
+        if len(tokens) == 1:
+            pos, _, line = fragment_postings(index, tokens[0])
+        else:
+            postings = ([fragment_postings(index, tokens[0], anchor="end")]
+                        + [term_postings(index, [index["vocab"].get(t)]) for t in tokens[1:-1]]
+                        + [fragment_postings(index, tokens[-1], anchor="start")])
+            pos, _, line = phrase_occurrences(postings)
+        target_pos.append(pos)
+        target_line.append(line)
+    target_pos = np.concatenate(target_pos)
+    target_line = np.concatenate(target_line)
 
-# Affichage du tableau des statistiques
-print(df)
+    # Une ligne compte si sa dernière cible est après son premier sujet
+    if not len(target_line):
+        return EMPTY
+    order = np.lexsort((target_pos, target_line))
+    target_pos, target_line = target_pos[order], target_line[order]
+    last = np.maximum(np.searchsorted(target_line, lines, side="right") - 1, 0)
+    counted = (target_line[last] == lines) & (target_pos[last] > first_pos)
+    return first_page[counted]
+
+# Variante de count_book_pages qui répond à partir de l'index positionnel (construit au premier passage)
+def count_book_pages_from_index(pdf_path, stats=STATS):
+    index = get_index(pdf_path)
+    columns = [np.bincount(stat_pages_from_index(index, stat), minlength=index["n_pages"]) for stat in stats]
+    return np.stack(columns, axis=1).tolist()
+
+# Variante de analyze_book qui répond à partir de l'index positionnel
+def analyze_book_from_index(pdf_path, book_name):
+    page_counts = count_book_pages_from_index(pdf_path)
+    return book_stats(book_name, len(page_counts), page_totals(page_counts)), page_counts
+
+# Fonction pour exécuter function(*job) pour chaque job, en parallèle sur plusieurs processus
+# si workers > 1. Le premier argument de chaque job est un chemin de PDF : les plus gros fichiers
+# partent en premier pour équilibrer la charge. Les résultats sont toujours rendus dans l'ordre
+# des jobs, quel que soit l'ordre de fin.
+def run_jobs(function, jobs, workers=1):
+    if workers <= 1 or len(jobs) <= 1:
+        return [function(*job) for job in jobs]
+
+    order = sorted(range(len(jobs)), key=lambda i: os.path.getsize(jobs[i][0]), reverse=True)
+    results = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+        futures = {executor.submit(function, *jobs[i]): i for i in order}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    return results
+
+# Fonction pour analyser tous les livres, en parallèle si workers > 1
+# Renvoie un couple (statistiques, comptes par page) par livre, dans l'ordre de pdf_files.
+# analyze est la fonction d'analyse d'un livre : analyze_book ou analyze_book_from_index.
+def analyze_corpus(pdf_files, workers=1, analyze=analyze_book):
+    jobs = [(pdf, f"HP{i+1}") for i, pdf in enumerate(pdf_files)]
+    return run_jobs(analyze, jobs, workers)
 
 # ----------------------------
-# Visualisations
+# Manifeste pour la réanalyse incrémentale
 # ----------------------------
+# Le manifeste garde, pour chaque PDF, l'empreinte de son contenu et, pour chaque statistique,
+# l'empreinte de sa définition avec ses comptes par page. Il garde aussi l'empreinte des
+# données de chaque graphique. Une relance ne recompte que les couples (livre, statistique)
+# dont le PDF ou la définition a changé, et ne redessine que les graphiques concernés.
+manifest_path = os.path.join(cache_folder, "manifest.json")
+
+# Fonction pour lire le manifeste (vide s'il n'existe pas encore)
+def load_manifest():
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding="utf-8") as f:
+        return json.load(f)
+
+# Fonction pour écrire le manifeste (écriture atomique)
+def save_manifest(manifest):
+    os.makedirs(cache_folder, exist_ok=True)
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+# Fonction pour calculer l'empreinte d'un objet sérialisable en JSON
+def fingerprint(obj):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+# Fonction pour décrire le moteur de comptage : les deux moteurs peuvent donner des comptes
+# différents (voir stat_pages_from_index), changer de moteur ou de version d'index invalide donc
+# les comptes enregistrés
+def counting_backend(count_pages):
+    if count_pages is count_book_pages_from_index:
+        return {"moteur": "index", "version_index": INDEX_VERSION}
+    return {"moteur": "regex"}
 
-# Création du dossier plots s'il n'existe pas
-os.makedirs("./plots", exist_ok=True)
+# Fonction pour calculer l'empreinte de la définition d'une statistique et du moteur qui l'a comptée
+# ("par_100_pages" ne change pas les comptes et n'en fait pas partie)
+def stat_fingerprint(stat, backend):
+    definition = {key: value for key, value in stat.items() if key != "par_100_pages"}
+    return fingerprint({"statistique": definition, "moteur": backend})
+
+# Fonction pour analyser le corpus en ne recalculant que ce qui a changé depuis le manifeste
+# Même résultat que analyze_corpus ; count_pages est count_book_pages ou count_book_pages_from_index.
+def analyze_corpus_incremental(manifest, pdf_files, workers=1, count_pages=count_book_pages):
+    books = manifest.setdefault("books", {})
+    for pdf in set(books) - set(pdf_files):
+        del books[pdf]
+
+    # Recherche des couples (livre, statistique) à recalculer
+    names = {stat["nom"] for stat in STATS}
+    backend = counting_backend(count_pages)
+    jobs = []
+    for pdf in pdf_files:
+        pdf_hash = file_hash(pdf)
+        entry = books.get(pdf)
+        if entry is None or entry["hash"] != pdf_hash:
+            entry = books[pdf] = {"hash": pdf_hash, "stats": {}}
+        entry["stats"] = {name: value for name, value in entry["stats"].items() if name in names}
+        stale = [stat for stat in STATS
+                 if entry["stats"].get(stat["nom"], {}).get("definition") != stat_fingerprint(stat, backend)]
+        if stale:
+            jobs.append((pdf, stale))
+
+    for (pdf, stale), page_counts in zip(jobs, run_jobs(count_pages, jobs, workers)):
+        entry = books[pdf]
+        entry["n_pages"] = len(page_counts)
+        for i, stat in enumerate(stale):
+            entry["stats"][stat["nom"]] = {"definition": stat_fingerprint(stat, backend),
+                                           "pages": [counts[i] for counts in page_counts]}
+    n_units = sum(len(stale) for _, stale in jobs)
+    print(f"Manifeste : {n_units} statistique(s) recalculée(s) sur {len(jobs)} livre(s)")
+
+    results = []
+    for i, pdf in enumerate(pdf_files):
+        entry = books[pdf]
+        page_counts = [list(counts) for counts in zip(*(entry["stats"][stat["nom"]]["pages"] for stat in STATS))]
+        results.append((book_stats(f"HP{i+1}", entry["n_pages"], page_totals(page_counts)), page_counts))
+    return results
+
+# Fonction pour extraire un livre sans rien compter : remplit le cache de pages (et l'index)
+def extract_book(pdf_path, use_index=False):
+    if use_index:
+        return get_index(pdf_path)["n_pages"]
+    return sum(1 for _ in iter_pages(pdf_path))
+
+# Fonction pour construire le tableau des statistiques (une ligne par livre)
+# et le tableau des comptes par page (une ligne par page de chaque livre)
+def stats_dataframes(results):
+    import pandas as pd
+
+    df = pd.DataFrame([stats for stats, _ in results])
+    rows = [[stats["Livre"], page_no, *counts]
+            for stats, page_counts in results
+            for page_no, counts in enumerate(page_counts, start=1)]
+    df_pages = pd.DataFrame(rows, columns=["Livre", "Page"] + [stat["nom"] for stat in STATS])
+    return df, df_pages
 
 # ----------------------------
-# Bar plot des occurrences brutes
+# Sorties sur disque
 # ----------------------------
-fig, ax = plt.subplots(figsize=(12,6))
-df_plot = df.set_index("Livre")[["Harry_cicatrice", "Hermione_mais", "Dumbledore_interfere", "Rogue_dark", "Actes_illicites"]]
-df_plot.plot(kind="bar", ax=ax)
-plt.title("Statistiques par livre - Harry Potter")
-plt.ylabel("Nombre d'occurrences")
-plt.xticks(rotation=0)
+# - livres.parquet : tableau des statistiques (format en colonnes, chaque colonne se relit seule)
+# - pages.npy : matrice pages x statistiques (int32), relue en mmap par load_page_matrix
+# - pages.json : noms des colonnes de la matrice et plage de lignes de chaque livre
+stats_folder = "./stats"
+
+# Fonction pour enregistrer le tableau des statistiques et la matrice des comptes par page
+def save_stats(df, results):
+    os.makedirs(stats_folder, exist_ok=True)
+    try:
+        df.to_parquet(os.path.join(stats_folder, "livres.parquet"), index=False)
+    except ImportError:
+        print("pyarrow (ou fastparquet) n'est pas installé : livres.parquet n'est pas écrit")
+
+    # Écriture ligne par ligne dans le fichier mappé en mémoire, livre après livre
+    n_rows = sum(len(page_counts) for _, page_counts in results)
+    matrix_path = os.path.join(stats_folder, "pages.npy")
+    tmp_path = f"{matrix_path}.{os.getpid()}.tmp"
+    matrix = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.int32, shape=(n_rows, len(STATS)))
+    books = []
+    row = 0
+    for stats, page_counts in results:
+        if page_counts:
+            matrix[row:row + len(page_counts)] = page_counts
+        books.append({"livre": stats["Livre"], "debut": row, "fin": row + len(page_counts)})
+        row += len(page_counts)
+    matrix.flush()
+    del matrix
+    os.replace(tmp_path, matrix_path)
+    with open(os.path.join(stats_folder, "pages.json"), "w", encoding="utf-8") as f:
+        json.dump({"colonnes": [stat["nom"] for stat in STATS], "livres": books}, f, ensure_ascii=False, indent=2)
 
-# Sauvegarde du graphique
-plt.savefig("./plots/statistiques_brutes.png", bbox_inches='tight', dpi=300)
-plt.close(fig)  # ferme le graphique pour ne pas afficher à l'écran
+# Fonction pour relire la matrice des comptes par page sans la charger (mmap)
+# Renvoie la matrice, le nom de ses colonnes et la plage de lignes de chaque livre.
+def load_page_matrix(folder=stats_folder):
+    with open(os.path.join(folder, "pages.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    matrix = np.load(os.path.join(folder, "pages.npy"), mmap_mode="r")
+    books = {book["livre"]: slice(book["debut"], book["fin"]) for book in meta["livres"]}
+    return matrix, meta["colonnes"], books
+
+# Fonction pour compter les occurrences sur une fenêtre glissante de `window` pages
+# (par exemple par 100 pages) : ligne i = somme des pages i à i + window - 1, pour chaque colonne.
+# Calcul vectorisé par sommes cumulées, sans boucle sur les pages.
+def rolling_counts(page_matrix, window=100):
+    cumulative = np.zeros((len(page_matrix) + 1, page_matrix.shape[1]), dtype=np.int64)
+    np.cumsum(page_matrix, axis=0, out=cumulative[1:])
+    return cumulative[window:] - cumulative[:-window]
 
 # ----------------------------
-# Bar plot des occurrences normalisées par 100 pages
+# Visualisations
 # ----------------------------
-fig, ax = plt.subplots(figsize=(12,6))
-df_plot2 = df.set_index("Livre")[[
-    "Harry_cicatrice_par_100_pages", 
-    "Hermione_mais_par_100_pages", 
-    "Dumbledore_interfere_par_100_pages", 
-    "Rogue_dark_par_100_pages", 
-    "Actes_illicites_par_100_pages"]]
-df_plot2.plot(kind="bar", ax=ax)
-plt.title("Statistiques par 100 pages - Harry Potter")
-plt.ylabel("Occurrences par 100 pages")
-plt.xticks(rotation=0)
-
-# Sauvegarde du graphique
-plt.savefig("./plots/statistiques_100_pages.png", bbox_inches='tight', dpi=300)
-plt.close(fig)
-
-# Comparaison du nombre de prises de parole
-fig, ax = plt.subplots(figsize=(10,6))
-
-# Sélection des colonnes de prises de parole
-df_speak = df.set_index("Livre")[["Harry_speak", "Hermione_speak", "Ron_speak"]]
-
-# Bar plot
-df_speak.plot(kind="bar", ax=ax)
-plt.title("Comparaison du nombre de prises de parole par livre")
-plt.ylabel("Nombre d'occurrences du nom (approximation)")
-plt.xticks(rotation=0)
-
-# Sauvegarde du graphique
-os.makedirs("./plots", exist_ok=True)
-plt.savefig("./plots/prises_de_parole.png", bbox_inches='tight', dpi=300)
-plt.close(fig)
+# Un bar plot par entrée : colonnes du DataFrame (une barre par livre), titre et axe des y
+PLOTS = [
+    # Bar plot des occurrences brutes
+    {"fichier": "./plots/statistiques_brutes.png",
+     "colonnes": ["Harry_cicatrice", "Hermione_mais", "Dumbledore_interfere", "Rogue_dark", "Actes_illicites"],
+     "titre": "Statistiques par livre - Harry Potter",
+     "ylabel": "Nombre d'occurrences",
+     "taille": [12, 6]},
+    # Bar plot des occurrences normalisées par 100 pages
+    {"fichier": "./plots/statistiques_100_pages.png",
+     "colonnes": [
+         "Harry_cicatrice_par_100_pages", 
+         "Hermione_mais_par_100_pages", 
+         "Dumbledore_interfere_par_100_pages", 
+         "Rogue_dark_par_100_pages", 
+         "Actes_illicites_par_100_pages"],
+     "titre": "Statistiques par 100 pages - Harry Potter",
+     "ylabel": "Occurrences par 100 pages",
+     "taille": [12, 6]},
+    # Comparaison du nombre de prises de parole
+    {"fichier": "./plots/prises_de_parole.png",
+     "colonnes": ["Harry_speak", "Hermione_speak", "Ron_speak"],
+     "titre": "Comparaison du nombre de prises de parole par livre",
+     "ylabel": "Nombre d'occurrences du nom (approximation)",
+     "taille": [10, 6]},
+]
+
+# Fonction pour importer et configurer les bibliothèques de dessin (une fois par processus)
+# Le backend Agg, non interactif, dessine directement dans les fichiers PNG.
+def setup_plotting():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    # Configuration de Seaborn pour les graphes
+    sns.set(style="whitegrid")
+    return plt
+
+# Fonction pour dessiner et sauvegarder un graphique
+# data contient seulement les colonnes du graphique, indexées par livre
+def render_plot(data, plot):
+    plt = setup_plotting()
+    fig, ax = plt.subplots(figsize=plot["taille"])
+    data.plot(kind="bar", ax=ax)
+    plt.title(plot["titre"])
+    plt.ylabel(plot["ylabel"])
+    plt.xticks(rotation=0)
+
+    # Sauvegarde du graphique
+    plt.savefig(plot["fichier"], bbox_inches='tight', dpi=300)
+    plt.close(fig)  # ferme le graphique pour ne pas afficher à l'écran
+
+# Fonction pour calculer l'empreinte d'un graphique : sa définition et les données qu'il affiche
+def plot_fingerprint(df, plot):
+    return fingerprint({"plot": plot, "data": df.set_index("Livre")[plot["colonnes"]].to_json()})
+
+# Fonction pour dessiner les graphiques dont les données ont changé depuis le manifeste
+# (ou tous, sans manifeste). Les empreintes des graphiques dessinés y sont enregistrées.
+# Avec workers > 1, les graphiques sont dessinés en même temps dans des processus séparés.
+def plot_statistics(df, manifest=None, workers=1):
+    # Création du dossier plots s'il n'existe pas
+    os.makedirs("./plots", exist_ok=True)
+
+    plot_fingerprints = {} if manifest is None else manifest.setdefault("plots", {})
+    stale = [(plot, plot_fingerprint(df, plot)) for plot in PLOTS]
+    stale = [(plot, plot_hash) for plot, plot_hash in stale
+             if plot_fingerprints.get(plot["fichier"]) != plot_hash or not os.path.exists(plot["fichier"])]
+    jobs = [(df.set_index("Livre")[plot["colonnes"]], plot) for plot, _ in stale]
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            render_plot(*job)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            for future in [executor.submit(render_plot, *job) for job in jobs]:
+                future.result()
+
+    for plot, plot_hash in stale:
+        plot_fingerprints[plot["fichier"]] = plot_hash
+        print(f"Graphique dessiné : {plot['fichier']}")
 
 # Affichage du personnage le plus bavard par livre
-df_speak["Personnage_le_plus_bavard"] = df_speak.idxmax(axis=1)
-print(df_speak[["Personnage_le_plus_bavard"]])
+def print_most_talkative(df):
+    df_speak = df.set_index("Livre")[["Harry_speak", "Hermione_speak", "Ron_speak"]]
+    df_speak["Personnage_le_plus_bavard"] = df_speak.idxmax(axis=1)
+    print(df_speak[["Personnage_le_plus_bavard"]])
+
+STAGES = ["extract", "stats", "plots"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Statistiques sur les livres Harry Potter")
+    parser.add_argument("stages", nargs="*", metavar="etape",
+                        help="étapes à exécuter parmi extract (texte des PDF), stats (tableaux) "
+                             "et plots (graphiques) ; par défaut toutes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="nombre de processus pour l'analyse des PDF (1 = séquentiel, défaut : nombre de cœurs)")
+    parser.add_argument("--index", action="store_true",
+                        help="calculer les statistiques à partir de l'index positionnel (construit au premier passage)")
+    parser.add_argument("--full", action="store_true",
+                        help="ignorer le manifeste et tout recalculer (livres, statistiques et graphiques)")
+    args = parser.parse_args()
+    stages = args.stages or STAGES
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"étape inconnue : {', '.join(sorted(unknown))} (choix : {', '.join(STAGES)})")
+
+    pdf_files = list_pdf_files(pdf_folder)
+
+    # Étape extract : texte des PDF (et index) mis en cache, sans comptage
+    if "extract" in stages:
+        n_pages = run_jobs(extract_book, [(pdf, args.index) for pdf in pdf_files], args.workers)
+        print(f"Extraction : {len(pdf_files)} livre(s), {sum(n_pages)} pages")
+    if "stats" not in stages and "plots" not in stages:
+        return
+
+    # Parcours de tous les fichiers PDF et création des DataFrames
+    # (seuls les livres et statistiques modifiés depuis la dernière exécution sont recalculés)
+    manifest = {} if args.full else load_manifest()
+    count_pages = count_book_pages_from_index if args.index else count_book_pages
+    results = analyze_corpus_incremental(manifest, pdf_files, workers=args.workers, count_pages=count_pages)
+    df, df_pages = stats_dataframes(results)
+
+    # Étape stats : affichage du tableau des statistiques
+    if "stats" in stages:
+        print(df)
+        print(f"Comptes par page : {len(df_pages)} pages x {len(STATS)} statistiques")
+        print_most_talkative(df)
+        save_stats(df, results)
+
+    # Étape plots : seuls les graphiques dont les données ont changé sont redessinés
+    if "plots" in stages:
+        plot_statistics(df, manifest, workers=args.workers)
+    save_manifest(manifest)
+
+if __name__ == "__main__":
+    main()
 
 
 # ----------------------------
@@ -155,4 +767,4 @@ Limites :
 - Comptage basé sur des mots-clés : certaines occurrences peuvent être manquées ou surcomptées.
 - La prise de parole par personnage est approximative (se base sur le nom seulement, pas sur le dialogue réel).
 - L'interprétation des actes illicites dépend de mots précis, certaines nuances sont ignorées.
-"""
\ No newline at end of file
+"""